@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Benchmark del preprocesado de image_bridge (reducir + recodificar antes de subir).
+
+Uso:
+  python python/bench/image_preprocess.py fotos/*.jpg [--mode ocr] [--call]
+
+Sin archivos usa python/bench/fixtures/*.{jpg,png,webp}; si tampoco hay,
+genera dos muestras sintéticas (foto 12MP con ruido y captura 4K con texto).
+Con --call (requiere GROQ_IMAGE_API_KEY) mide también la latencia de punta
+a punta de la llamada al modelo de visión con y sin preprocesado.
+"""
+import argparse
+import glob
+import mimetypes
+import os
+import sys
+import time
+from io import BytesIO
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import image_bridge as ib  # noqa: E402
+from PIL import Image, ImageDraw  # noqa: E402
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+def synthetic_samples():
+    photo = Image.frombytes("RGB", (4000, 3000), os.urandom(4000 * 3000 * 3))
+    buf = BytesIO()
+    photo.save(buf, format="JPEG", quality=92)
+    yield "photo_12mp.jpg", buf.getvalue(), "image/jpeg"
+
+    shot = Image.new("RGB", (3840, 2160), (30, 30, 36))
+    draw = ImageDraw.Draw(shot)
+    for i in range(60):
+        draw.text((40, 30 + i * 34), f"Línea {i}: Terra Blade 95 daño, Zenith 190 daño, velocidad {i % 7}", fill=(230, 230, 230))
+    buf = BytesIO()
+    shot.save(buf, format="PNG")
+    yield "screenshot_4k.png", buf.getvalue(), "image/png"
+
+
+def fixture_samples(paths):
+    for path in paths:
+        with open(path, "rb") as f:
+            yield os.path.basename(path), f.read(), mimetypes.guess_type(path)[0] or "image/jpeg"
+
+
+def timed(fn):
+    t0 = time.perf_counter()
+    out = fn()
+    return out, time.perf_counter() - t0
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("files", nargs="*")
+    ap.add_argument("--mode", default="describe", choices=["describe", "ask", "ocr", "analyze"])
+    ap.add_argument("--call", action="store_true")
+    args = ap.parse_args()
+
+    files = args.files or sorted(
+        p for p in glob.glob(os.path.join(FIXTURES_DIR, "*")) if p.lower().endswith((".jpg", ".jpeg", ".png", ".webp"))
+    )
+    samples = fixture_samples(files) if files else synthetic_samples()
+    key, model = ib.env_key(), ib.env_model()
+    prompt = ib.prompt_for_mode(args.mode, "")
+
+    print(f"{'imagen':<22} {'payload KB (orig/env)':>22} {'prep s':>7} {'llamada s (orig/env)':>21}")
+    for name, raw, mime in samples:
+        (sent, sent_mime, info), t_prep = timed(lambda: ib.prepare_image(raw, mime, args.mode))
+        url_orig = ib.to_data_url(raw, mime)
+        url_sent = ib.to_data_url(sent, sent_mime)
+
+        calls = "-"
+        if args.call and key:
+            _, t_orig = timed(lambda: ib.groq_chat_with_image(url_orig, prompt, model=model, api_key=key))
+            _, t_sent = timed(lambda: ib.groq_chat_with_image(url_sent, prompt, model=model, api_key=key))
+            calls = f"{t_orig:.2f}/{t_prep + t_sent:.2f}"
+
+        print(
+            f"{name[:22]:<22} "
+            f"{len(url_orig) / 1024:>10.0f}/{len(url_sent) / 1024:<11.0f} "
+            f"{t_prep:>7.3f} "
+            f"{calls:>21}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Benchmark del preprocesado de audio de video_bridge (quitar silencios / atempo).
+
+Uso:
+  python python/bench/video_preprocess.py fixtures/*.mp3 [--speed 1.25] [--transcribe]
+
+Sin archivos usa python/bench/fixtures/*. Si no hay fixtures se genera uno
+sintético (tonos separados por silencios) sólo para medir tamaño y tiempos.
+Con --transcribe (requiere GROQ_VIDEO_API_KEY) también compara la
+transcripción con y sin preprocesado.
+"""
+import argparse
+import difflib
+import glob
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import video_bridge as vb  # noqa: E402
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+def synthetic_fixture(path, seconds=120):
+    # 5s de tono + 10s de silencio, en bucle
+    expr = "if(lt(mod(t\\,15)\\,5)\\,0.5*sin(2*PI*440*t)\\,0)"
+    cmd = [
+        "ffmpeg", "-y", "-f", "lavfi",
+        "-i", f"aevalsrc={expr}:s=44100:d={seconds}",
+        "-b:a", "128k", path
+    ]
+    subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+    return path
+
+
+def measure(fn):
+    t0 = time.perf_counter()
+    out = fn()
+    return out, time.perf_counter() - t0
+
+
+def bench_file(path, workdir, speed, client=None):
+    base = os.path.join(workdir, "base.mp3")
+    pre = os.path.join(workdir, "pre.mp3")
+
+    _, t_base = measure(lambda: vb.compress_for_whisper(path, base))
+    _, t_pre = measure(lambda: vb.preprocess_for_whisper(path, pre, True, speed))
+
+    row = {
+        "file": os.path.basename(path),
+        "dur_base": vb.probe_duration(base),
+        "dur_pre": vb.probe_duration(pre),
+        "kb_base": os.path.getsize(base) / 1024,
+        "kb_pre": os.path.getsize(pre) / 1024,
+        "t_base": t_base,
+        "t_pre": t_pre,
+    }
+
+    if client is not None:
+        segs_base, tw_base = measure(lambda: vb.transcribe_audio(client, path))
+        segs_pre, tw_pre = measure(lambda: vb.transcribe_audio(client, path, 0.0, True, speed))
+        # Sólo el texto: los timestamps cambian con la velocidad y bajarían la similitud
+        text_base = " ".join(s["text"] for s in segs_base)
+        text_pre = " ".join(s["text"] for s in segs_pre)
+        row["t_base"] += tw_base
+        row["t_pre"] += tw_pre
+        row["similarity"] = difflib.SequenceMatcher(None, text_base, text_pre).ratio()
+
+    return row
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("files", nargs="*")
+    ap.add_argument("--speed", type=float, default=1.0)
+    ap.add_argument("--transcribe", action="store_true")
+    args = ap.parse_args()
+
+    vb.require_ffmpeg()
+    client = vb.get_client() if args.transcribe else None
+
+    with tempfile.TemporaryDirectory(prefix="ceniza_bench_") as workdir:
+        files = args.files or sorted(glob.glob(os.path.join(FIXTURES_DIR, "*")))
+        if not files:
+            files = [synthetic_fixture(os.path.join(workdir, "synthetic.mp3"))]
+
+        print(f"{'archivo':<24} {'dur s':>13} {'tamaño KB':>15} {'tiempo s':>13} {'similitud':>9}")
+        for path in files:
+            r = bench_file(path, workdir, args.speed, client)
+            sim = f"{r['similarity']:.3f}" if "similarity" in r else "-"
+            print(
+                f"{r['file'][:24]:<24} "
+                f"{r['dur_base']:>6.1f}/{r['dur_pre']:<6.1f} "
+                f"{r['kb_base']:>7.0f}/{r['kb_pre']:<7.0f} "
+                f"{r['t_base']:>6.2f}/{r['t_pre']:<6.2f} "
+                f"{sim:>9}"
+            )
+        print("(valores: sin / con preprocesado)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Benchmark del watermark de pollinations_bridge en los tamaños soportados.
+
+Uso:
+  python python/bench/watermark.py [--repeat 5]
+
+Compara el algoritmo anterior (overlay completo + alpha_composite + PNG
+optimize=True) con add_watermark en PNG (compress_level configurable) y
+WebP sin pérdidas. Las imágenes de entrada son JPEG sintéticos con ruido,
+como los que devuelve Pollinations.
+"""
+import argparse
+import os
+import sys
+import time
+from io import BytesIO
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pollinations_bridge as pb  # noqa: E402
+from PIL import Image, ImageDraw, ImageFont  # noqa: E402
+
+SIZES = [256, 512, 1024, 1536, 2048]
+
+
+def legacy_watermark(png_bytes: bytes, text: str = "CenizaGPT") -> bytes:
+    # Copia del algoritmo original, para comparar
+    img = Image.open(BytesIO(png_bytes)).convert("RGBA")
+    w, h = img.size
+    overlay = Image.new("RGBA", img.size, (0, 0, 0, 0))
+    draw = ImageDraw.Draw(overlay)
+    font_size = max(18, int(w * 0.045))
+    margin = max(12, int(w * 0.02))
+    font = None
+    for fp in pb.FONT_CANDIDATES:
+        if os.path.exists(fp):
+            try:
+                font = ImageFont.truetype(fp, font_size)
+                break
+            except Exception:
+                pass
+    if font is None:
+        font = ImageFont.load_default()
+    bbox = draw.textbbox((0, 0), text, font=font)
+    x = w - (bbox[2] - bbox[0]) - margin
+    y = h - (bbox[3] - bbox[1]) - margin
+    so = max(2, int(font_size * 0.08))
+    draw.text((x + so, y + so), text, font=font, fill=(0, 0, 0, 160))
+    draw.text((x + so // 2, y + so // 2), text, font=font, fill=(0, 0, 0, 120))
+    draw.text((x, y), text, font=font, fill=(255, 255, 255, 210))
+    out = Image.alpha_composite(img, overlay).convert("RGBA")
+    buf = BytesIO()
+    out.save(buf, format="PNG", optimize=True)
+    return buf.getvalue()
+
+
+def sample(size: int) -> bytes:
+    # Ruido suave (mezcla de ruido y degradado) para no ser ni trivial ni incomprimible
+    noise = Image.frombytes("RGB", (size, size), os.urandom(size * size * 3))
+    grad = Image.linear_gradient("L").resize((size, size)).convert("RGB")
+    img = Image.blend(grad, noise, 0.25)
+    buf = BytesIO()
+    img.save(buf, format="JPEG", quality=90)
+    return buf.getvalue()
+
+
+def bench(fn, data: bytes, repeat: int) -> tuple[float, int]:
+    out = fn(data)
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        out = fn(data)
+    return (time.perf_counter() - t0) / repeat * 1000, len(out)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--repeat", type=int, default=5)
+    args = ap.parse_args()
+
+    variants = [
+        ("anterior", legacy_watermark),
+        (f"png l{pb.PNG_COMPRESS_LEVEL}", lambda d: pb.add_watermark(d, fmt="png")[0]),
+        ("webp lossless", lambda d: pb.add_watermark(d, fmt="webp")[0]),
+    ]
+
+    print(f"{'tamaño':>7} " + " ".join(f"{name:>22}" for name, _ in variants))
+    print(f"{'':>7} " + " ".join(f"{'ms / KB':>22}" for _ in variants))
+    for size in SIZES:
+        data = sample(size)
+        cells = []
+        for _, fn in variants:
+            ms, n = bench(fn, data, args.repeat)
+            cells.append(f"{ms:>12.1f} / {n / 1024:<7.0f}")
+        print(f"{size:>7} " + " ".join(cells))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Caché de imágenes generadas por pollinations_bridge.
+
+Pollinations es determinista para (prompt, modelo, seed, tamaño, quality,
+enhance, safe, imagen base): la clave es el sha256 de esa tupla normalizada
+más lo que cambia los bytes finales (texto del watermark y formato de
+salida). La API key nunca entra en la clave.
+
+- Guarda los bytes finales (ya con watermark) en SQLite.
+- Desalojo LRU por tamaño total (POLLINATIONS_CACHE_MAX_MB).
+- Single-flight: flock por clave (repartido en franjas), así dos procesos
+  con la misma petición hacen una sola llamada; el segundo espera al primero
+  y sale de la caché.
+"""
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+try:
+    import fcntl
+except Exception:
+    fcntl = None
+
+CACHE_ENABLED = os.getenv("POLLINATIONS_CACHE", "1") not in ("0", "false", "no")
+CACHE_PATH = os.getenv("POLLINATIONS_CACHE_PATH", os.path.join(tempfile.gettempdir(), "ceniza_gen_cache.sqlite"))
+CACHE_MAX_BYTES = int(float(os.getenv("POLLINATIONS_CACHE_MAX_MB", "512")) * 1024 * 1024)
+LOCK_DIR = os.getenv("POLLINATIONS_CACHE_LOCK_DIR", os.path.join(tempfile.gettempdir(), "ceniza_gen_locks"))
+
+# 16^3 = 4096 archivos de lock como mucho; dos claves distintas en la misma
+# franja sólo se esperan entre sí, no se mezclan
+LOCK_STRIPE_CHARS = 3
+
+
+def normalize_prompt(prompt: str) -> str:
+    # Sólo espacios: mayúsculas y puntuación sí cambian la imagen
+    return re.sub(r"\s+", " ", (prompt or "").strip())
+
+
+def cache_key(
+    prompt: str,
+    model: str,
+    seed: int,
+    width: int,
+    height: int,
+    quality: str,
+    enhance: str,
+    safe: str,
+    nologo: str = "",
+    image: str = "",
+    watermark: str = "",
+    fmt: str = "",
+) -> str:
+    parts = {
+        "prompt": normalize_prompt(prompt),
+        "model": (model or "").strip().lower(),
+        "seed": int(seed),
+        "width": int(width),
+        "height": int(height),
+        "quality": str(quality).strip().lower(),
+        "enhance": str(enhance).strip().lower(),
+        "safe": str(safe).strip().lower(),
+        "nologo": str(nologo).strip().lower(),
+        "image": (image or "").strip(),
+        "watermark": watermark or "",
+        "fmt": fmt or "",
+    }
+    raw = json.dumps(parts, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class GenerationCache:
+    def __init__(self, path: str = CACHE_PATH):
+        self.db = sqlite3.connect(path, timeout=10)
+        self.db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS generations (
+                key TEXT PRIMARY KEY,
+                data BLOB NOT NULL,
+                meta TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                used REAL NOT NULL
+            )
+            """
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS generations_used ON generations (used)")
+        self.db.commit()
+
+    def get(self, key: str) -> Optional[tuple[bytes, dict]]:
+        """Devuelve (bytes, meta) o None (también si la base está ocupada/rota)."""
+        try:
+            row = self.db.execute("SELECT data, meta FROM generations WHERE key=?", (key,)).fetchone()
+            if not row:
+                return None
+            self.db.execute("UPDATE generations SET used=? WHERE key=?", (time.time(), key))
+            self.db.commit()
+        except sqlite3.Error:
+            return None
+        try:
+            meta = json.loads(row[1])
+        except ValueError:
+            meta = {}
+        return bytes(row[0]), meta
+
+    def put(self, key: str, data: bytes, meta: dict) -> None:
+        if len(data) > CACHE_MAX_BYTES:
+            return
+        now = time.time()
+        try:
+            self.db.execute(
+                "INSERT OR REPLACE INTO generations (key, data, meta, size, created, used) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, sqlite3.Binary(data), json.dumps(meta, ensure_ascii=False), len(data), now, now),
+            )
+            self._evict()
+            self.db.commit()
+        except sqlite3.Error:
+            # Sin caché seguimos igual: la imagen ya la tenemos
+            pass
+
+    def _evict(self) -> None:
+        # Acumulado de tamaño de la más reciente a la más vieja; fuera lo que pase el tope
+        self.db.execute(
+            "DELETE FROM generations WHERE key IN ("
+            "SELECT key FROM (SELECT key, SUM(size) OVER (ORDER BY used DESC) AS acc FROM generations) "
+            "WHERE acc > ?)",
+            (CACHE_MAX_BYTES,),
+        )
+
+    def close(self) -> None:
+        self.db.close()
+
+
+def open_cache() -> Optional[GenerationCache]:
+    if not CACHE_ENABLED:
+        return None
+    try:
+        return GenerationCache()
+    except sqlite3.Error:
+        return None
+
+
+@contextmanager
+def single_flight(key: str):
+    """
+    Exclusión entre procesos (y entre hilos: cada uno abre su propio fd) para
+    la misma clave. Sin fcntl (Windows) no hay exclusión y cada uno pide lo suyo.
+    """
+    if fcntl is None:
+        yield
+        return
+    try:
+        os.makedirs(LOCK_DIR, exist_ok=True)
+        fd = os.open(os.path.join(LOCK_DIR, f"{key[:LOCK_STRIPE_CHARS]}.lock"), os.O_RDWR | os.O_CREAT, 0o644)
+    except OSError:
+        yield
+        return
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
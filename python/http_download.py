@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Descarga HTTP compartida por los bridges (image_bridge, pollinations_bridge).
+
+- Sesión con pool de conexiones reutilizada entre descargas.
+- Lectura en streaming con tope de bytes: corta antes de bajar nada si el
+  Content-Length ya supera el tope, y en cuanto se pasa si no lo trae.
+- Tipo real detectado por magic bytes (no nos fiamos del content-type).
+- Reintento con headers de navegador SÓLO si el fallo parece de headers
+  (403 y similares), nunca por timeouts o enlaces muertos.
+"""
+from typing import Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+CHUNK_SIZE = 64 * 1024
+
+# Códigos que suelen significar "no me gusta tu User-Agent / Accept"
+HEADER_RELATED_STATUS = {401, 403, 406, 429}
+
+_SESSION: Optional[requests.Session] = None
+
+
+class DownloadError(Exception):
+    def __init__(self, message: str, status: Optional[int] = None, body: str = ""):
+        super().__init__(message)
+        self.status = status
+        self.body = body
+
+
+def session() -> requests.Session:
+    global _SESSION
+    if _SESSION is None:
+        s = requests.Session()
+        adapter = HTTPAdapter(pool_connections=8, pool_maxsize=16, max_retries=0)
+        s.mount("http://", adapter)
+        s.mount("https://", adapter)
+        _SESSION = s
+    return _SESSION
+
+
+def sniff_mime(data: bytes) -> Optional[str]:
+    head = bytes(data[:32])
+    if head.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return "image/gif"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    if head[:2] == b"BM":
+        return "image/bmp"
+    if head[4:8] == b"ftyp":
+        brand = head[8:12]
+        if brand in (b"avif", b"avis"):
+            return "image/avif"
+        if brand in (b"heic", b"heix", b"mif1", b"msf1"):
+            return "image/heic"
+    return None
+
+
+def _read_limited(resp: requests.Response, max_bytes: int) -> bytes:
+    length = resp.headers.get("content-length")
+    expected = int(length) if length and length.isdigit() else None
+    if expected is not None and expected > max_bytes:
+        raise DownloadError(f"too_large: {expected} bytes (max {max_bytes})", resp.status_code)
+
+    if expected:
+        # Buffer preasignado: una sola reserva y sin concatenaciones
+        buf = bytearray(expected)
+        view = memoryview(buf)
+        pos = 0
+        for chunk in resp.iter_content(CHUNK_SIZE):
+            end = pos + len(chunk)
+            if end > expected:
+                if end > max_bytes:
+                    raise DownloadError(f"too_large: >{max_bytes} bytes", resp.status_code)
+                # Content-Length mentía (o venía comprimido): pasamos a crecer
+                buf = bytearray(view[:pos])
+                buf += chunk
+                for rest in resp.iter_content(CHUNK_SIZE):
+                    buf += rest
+                    if len(buf) > max_bytes:
+                        raise DownloadError(f"too_large: >{max_bytes} bytes", resp.status_code)
+                return bytes(buf)
+            view[pos:end] = chunk
+            pos = end
+        return bytes(view[:pos])
+
+    buf = bytearray()
+    for chunk in resp.iter_content(CHUNK_SIZE):
+        buf += chunk
+        if len(buf) > max_bytes:
+            raise DownloadError(f"too_large: >{max_bytes} bytes", resp.status_code)
+    return bytes(buf)
+
+
+def _fetch_once(url: str, params, headers, timeout, max_bytes) -> tuple[bytes, dict]:
+    try:
+        resp = session().get(url, params=params, headers=headers, timeout=timeout, stream=True, allow_redirects=True)
+    except requests.RequestException as e:
+        raise DownloadError(f"request_failed: {e}") from e
+
+    with resp:
+        if resp.status_code >= 400:
+            body = ""
+            try:
+                body = next(resp.iter_content(400), b"").decode("utf-8", errors="replace")
+            except Exception:
+                pass
+            raise DownloadError(f"http_{resp.status_code}: {resp.reason}", resp.status_code, body)
+        try:
+            data = _read_limited(resp, max_bytes)
+        except requests.RequestException as e:
+            raise DownloadError(f"read_failed: {e}", resp.status_code) from e
+        return data, resp.headers
+
+
+def fetch(
+    url: str,
+    params=None,
+    timeout: float = 15,
+    max_bytes: int = 25 * 1024 * 1024,
+    retry_headers: Optional[dict] = None,
+) -> tuple[bytes, str, dict]:
+    """
+    Descarga `url` con tope de `max_bytes`. Si falla con un código típico de
+    bloqueo por headers y hay `retry_headers`, reintenta una vez con ellos.
+    Devuelve (bytes, mime, headers); mime sale de los magic bytes si se
+    reconocen y si no del content-type.
+    """
+    try:
+        data, headers = _fetch_once(url, params, None, timeout, max_bytes)
+    except DownloadError as e:
+        if not retry_headers or e.status not in HEADER_RELATED_STATUS:
+            raise
+        data, headers = _fetch_once(url, params, retry_headers, timeout, max_bytes)
+
+    ctype = (headers.get("content-type") or "").split(";")[0].strip().lower()
+    return data, sniff_mime(data) or ctype, headers
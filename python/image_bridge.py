@@ -4,17 +4,36 @@ import base64
 import json
 import mimetypes
 import os
+import re
+import struct
 import sys
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, partial
+from io import BytesIO
 from typing import Optional
 from urllib.parse import urlparse
 
-import requests
+from http_download import DownloadError, fetch, sniff_mime
+from image_cache import content_hash, fingerprint, open_cache
 
 try:
     import groq
 except Exception:
     groq = None
 
+try:
+    from PIL import Image, ImageDraw, ImageOps, ImageSequence
+except Exception:
+    Image = None
+    ImageDraw = None
+    ImageOps = None
+    ImageSequence = None
+
+try:
+    import numpy as np
+except Exception:
+    np = None
+
 
 DEFAULT_HEADERS = {
     "User-Agent": "Mozilla/5.0 (X11; Linux x86_64) CenizaGPTBot/2.1 (+discord) PythonRequests",
@@ -25,6 +44,31 @@ DEFAULT_HEADERS = {
 }
 
 
+# Lado máximo por modo (OCR necesita más resolución para que el texto sea legible)
+MAX_SIDE = {
+    "describe": int(os.getenv("IMAGE_MAX_SIDE", "1280")),
+    "ask": int(os.getenv("IMAGE_MAX_SIDE", "1280")),
+    "analyze": int(os.getenv("IMAGE_MAX_SIDE", "1280")),
+    "ocr": int(os.getenv("IMAGE_OCR_MAX_SIDE", "2048")),
+}
+# Presupuesto de bytes de la imagen enviada (antes de base64)
+MAX_SEND_BYTES = int(os.getenv("IMAGE_MAX_SEND_BYTES", "1000000"))
+# Tope de descarga: por encima ni lo bajamos
+MAX_DOWNLOAD_BYTES = int(os.getenv("IMAGE_MAX_DOWNLOAD_BYTES", str(25 * 1024 * 1024)))
+JPEG_QUALITIES = (90, 82, 74, 66, 58)
+# Imágenes por petición que acepta el modelo de visión (llama-4-scout: 5)
+MAX_IMAGES_PER_REQUEST = int(os.getenv("IMAGE_MAX_PER_REQUEST", "5"))
+# Tamaño máximo de la petición con imágenes en base64 (Groq: 4 MB); con
+# MAX_SEND_BYTES por imagen, 5 imágenes en base64 pueden pasar de 6 MB
+MAX_REQUEST_BYTES = int(os.getenv("IMAGE_MAX_REQUEST_BYTES", str(3_500_000)))
+BATCH_WORKERS = int(os.getenv("IMAGE_BATCH_WORKERS", "4"))
+# GIF/WebP animados: fotogramas clave que van en la hoja de contactos
+MAX_FRAMES = int(os.getenv("IMAGE_MAX_FRAMES", "6"))
+# Fotogramas que se llegan a mirar para elegir los clave (los demás se saltan)
+SCAN_FRAMES = 240
+MODES = ["describe", "ask", "ocr", "analyze"]
+
+
 def eprint(*a):
     print(*a, file=sys.stderr)
 
@@ -50,72 +94,268 @@ def guess_mime_from_url(url: str) -> str:
     return mt or "image/jpeg"
 
 
-def load_image_bytes(source: str, timeout: int = 15) -> tuple[Optional[bytes], str]:
+# Entrada directa desde Node: cada imagen va como [uint32 big-endian largo][bytes]
+FRAME_HEADER = struct.Struct(">I")
+
+
+def _read_exact_into(stream, view: memoryview) -> None:
+    pos = 0
+    while pos < len(view):
+        n = stream.readinto(view[pos:])
+        if not n:
+            raise EOFError(f"entrada cortada ({pos}/{len(view)} bytes)")
+        pos += n
+
+
+def read_frame(stream) -> bytearray:
+    """Lee un frame con prefijo de largo directo a un buffer preasignado (sin copias intermedias)."""
+    header = bytearray(FRAME_HEADER.size)
+    _read_exact_into(stream, memoryview(header))
+    (length,) = FRAME_HEADER.unpack(header)
+    if length > MAX_DOWNLOAD_BYTES:
+        raise ValueError(f"imagen demasiado grande ({length} bytes, max {MAX_DOWNLOAD_BYTES})")
+    buf = bytearray(length)
+    _read_exact_into(stream, memoryview(buf))
+    return buf
+
+
+def resolve_inline_sources(sources: list[str]) -> list:
+    """
+    Sustituye las fuentes inline por sus bytes:
+    - "-": siguiente frame de stdin (en el orden de los --src)
+    - "fd:N": un frame del descriptor heredado N
+    """
+    out = []
+    for src in sources:
+        if src == "-":
+            out.append(read_frame(sys.stdin.buffer))
+        elif src.startswith("fd:") and src[3:].isdigit():
+            with os.fdopen(int(src[3:]), "rb", buffering=0, closefd=True) as f:
+                out.append(read_frame(f))
+        else:
+            out.append(src)
+    return out
+
+
+def source_label(source, index: int) -> str:
+    return source if isinstance(source, str) else f"inline:{index}"
+
+
+def load_image_bytes(source, timeout: int = 15) -> tuple[Optional[bytes], str]:
     """
-    - Si es URL: intenta sin headers, si falla reintenta con headers.
+    - Si son bytes (entrada inline desde Node): se usan tal cual.
+    - Si es URL: descarga en streaming con tope de bytes; reintenta con
+      headers sólo si el fallo parece de headers (403, etc.).
     - Si es path local: lee archivo.
+    El mime sale de los magic bytes cuando se reconocen.
     Devuelve (bytes, mime).
     """
+    if isinstance(source, (bytes, bytearray)):
+        return source, sniff_mime(source) or "image/jpeg"
+
     if is_http(source):
-        # 1) intento sin headers
-        try:
-            r = requests.get(source, timeout=timeout)
-            r.raise_for_status()
-            ctype = r.headers.get("content-type", "") or guess_mime_from_url(source)
-            if not ctype.startswith("image/"):
-                ctype = guess_mime_from_url(source)
-            return r.content, ctype
-        except Exception:
-            pass
-
-        # 2) reintento con headers
         try:
-            r = requests.get(source, headers=DEFAULT_HEADERS, timeout=timeout)
-            r.raise_for_status()
-            ctype = r.headers.get("content-type", "") or guess_mime_from_url(source)
-            if not ctype.startswith("image/"):
-                ctype = guess_mime_from_url(source)
-            return r.content, ctype
-        except Exception as e:
+            data, ctype, _ = fetch(
+                source,
+                timeout=timeout,
+                max_bytes=MAX_DOWNLOAD_BYTES,
+                retry_headers=DEFAULT_HEADERS,
+            )
+        except DownloadError as e:
             return None, f"download_failed: {e}"
+        if not ctype.startswith("image/"):
+            ctype = guess_mime_from_url(source)
+        return data, ctype
 
     # local
     try:
+        if os.path.getsize(source) > MAX_DOWNLOAD_BYTES:
+            return None, f"file_failed: archivo demasiado grande (max {MAX_DOWNLOAD_BYTES} bytes)"
         with open(source, "rb") as f:
             data = f.read()
-        ctype = mimetypes.guess_type(source)[0] or "image/jpeg"
+        ctype = sniff_mime(data) or mimetypes.guess_type(source)[0] or "image/jpeg"
         return data, ctype
     except Exception as e:
         return None, f"file_failed: {e}"
 
 
+def _encode(img, fmt: str, quality: int = 90) -> bytes:
+    buf = BytesIO()
+    if fmt == "PNG":
+        img.save(buf, format="PNG", compress_level=6)
+    elif fmt == "WEBP":
+        img.save(buf, format="WEBP", quality=quality, method=4)
+    else:
+        img.save(buf, format="JPEG", quality=quality, optimize=True, progressive=True)
+    return buf.getvalue()
+
+
+def _frame_signature(frame):
+    small = frame.convert("L").resize((32, 32), Image.BILINEAR)
+    return np.frombuffer(small.tobytes(), dtype=np.uint8) if np is not None else None
+
+
+def select_keyframes(img, count: int) -> list[tuple[int, float]]:
+    """
+    Elige hasta `count` fotogramas representativos por cambio de escena:
+    siempre el primero y luego los de mayor diferencia con el anterior
+    (sobre miniaturas de 32x32 en escala de grises, vectorizado con NumPy).
+    Sin NumPy reparte uniformemente. Devuelve [(índice, segundo)] en orden.
+    """
+    n = getattr(img, "n_frames", 1)
+    step = max(1, n // SCAN_FRAMES)
+    indices, times, sigs = [], [], []
+    t = 0.0
+    for i, frame in enumerate(ImageSequence.Iterator(img)):
+        if i % step == 0:
+            indices.append(i)
+            times.append(t)
+            sigs.append(_frame_signature(frame) if np is not None else None)
+        t += (frame.info.get("duration") or 100) / 1000.0
+
+    if len(indices) <= count:
+        return list(zip(indices, times))
+
+    if np is None:
+        picks = [round(k * (len(indices) - 1) / (count - 1)) for k in range(count)]
+    else:
+        stack = np.stack(sigs).astype(np.int16)
+        diffs = np.abs(np.diff(stack, axis=0)).mean(axis=1)
+        # diffs[k] = cambio entre el fotograma k y el k+1
+        order = np.argsort(diffs)[::-1] + 1
+        picks = [0] + sorted(int(k) for k in order[:count - 1])
+    return [(indices[k], times[k]) for k in sorted(set(picks))]
+
+
+def contact_sheet(img, count: int, max_side: int):
+    """Compone los fotogramas clave en una sola imagen con su número y segundo."""
+    keys = select_keyframes(img, count)
+    frames = []
+    for index, t in keys:
+        img.seek(index)
+        frames.append((img.convert("RGB"), t))
+    img.seek(0)
+
+    cols = int(len(frames) ** 0.5 + 0.999)
+    rows = (len(frames) + cols - 1) // cols
+    fw, fh = frames[0][0].size
+    scale = min(1.0, max_side / (cols * fw), max_side / (rows * fh))
+    cw, ch = max(1, int(fw * scale)), max(1, int(fh * scale))
+
+    sheet = Image.new("RGB", (cols * cw, rows * ch), (0, 0, 0))
+    draw = ImageDraw.Draw(sheet)
+    for pos, (frame, t) in enumerate(frames):
+        x, y = (pos % cols) * cw, (pos // cols) * ch
+        sheet.paste(frame.resize((cw, ch), Image.LANCZOS), (x, y))
+        label = f"#{pos + 1} {t:.1f}s"
+        box = draw.textbbox((x + 4, y + 4), label)
+        draw.rectangle((box[0] - 3, box[1] - 3, box[2] + 3, box[3] + 3), fill=(0, 0, 0))
+        draw.text((x + 4, y + 4), label, fill=(255, 255, 0))
+    return sheet, len(frames)
+
+
+def prepare_image(img_bytes: bytes, mime: str, mode: str, frames: int = MAX_FRAMES) -> tuple[bytes, str, dict]:
+    """
+    Decodifica con Pillow, aplica la orientación EXIF, descarta metadatos,
+    reduce al lado máximo del modo y recodifica dentro de MAX_SEND_BYTES.
+    Los GIF/WebP animados se convierten en una hoja de contactos con
+    `frames` fotogramas clave (info["frames"] indica cuántos).
+    Sin Pillow (o si no se puede decodificar) devuelve los bytes originales.
+    Devuelve (bytes, mime, info).
+    """
+    info = {"original_bytes": len(img_bytes), "sent_bytes": len(img_bytes), "mime": mime}
+    if Image is None:
+        return img_bytes, mime, info
+
+    max_side = MAX_SIDE.get(mode, MAX_SIDE["describe"])
+    try:
+        img = Image.open(BytesIO(img_bytes))
+        info["original_size"] = list(img.size)
+        animated = getattr(img, "is_animated", False) and frames > 1
+        # JPEG: decodificar ya reducido (mucho más rápido en fotos de 12MP)
+        if img.format == "JPEG":
+            img.draft("RGB", (max_side, max_side))
+        if animated:
+            img, info["frames"] = contact_sheet(img, frames, max_side)
+        else:
+            img.load()
+    except Exception as e:
+        eprint("[image_bridge] no pude decodificar, envío original:", repr(e))
+        return img_bytes, mime, info
+
+    img = ImageOps.exif_transpose(img)
+
+    has_alpha = img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info)
+    img = img.convert("RGBA" if has_alpha else "RGB")
+
+    if max(img.size) > max_side:
+        img.thumbnail((max_side, max_side), Image.LANCZOS)
+
+    out, out_mime = None, None
+    while out is None:
+        # OCR: PNG sin pérdidas si cabe (evita artefactos sobre el texto)
+        if mode == "ocr" and not has_alpha:
+            data = _encode(img, "PNG")
+            if len(data) <= MAX_SEND_BYTES:
+                out, out_mime = data, "image/png"
+                break
+        fmt, fmt_mime = ("WEBP", "image/webp") if has_alpha else ("JPEG", "image/jpeg")
+        for q in JPEG_QUALITIES:
+            data = _encode(img, fmt, q)
+            if len(data) <= MAX_SEND_BYTES:
+                out, out_mime = data, fmt_mime
+                break
+        if out is None:
+            if max(img.size) <= 256:
+                out, out_mime = data, fmt_mime
+                break
+            img = img.resize((max(1, int(img.width * 0.75)), max(1, int(img.height * 0.75))), Image.LANCZOS)
+
+    info.update({"sent_bytes": len(out), "sent_size": list(img.size), "mime": out_mime})
+    return out, out_mime, info
+
+
 def to_data_url(img_bytes: bytes, mime: str) -> str:
     b64 = base64.b64encode(img_bytes).decode("utf-8")
     return f"data:{mime};base64,{b64}"
 
 
-def groq_chat_with_image(data_url: str, prompt: str, model: str, api_key: str, max_tokens: int = 1000) -> str:
+def groq_chat_with_images(
+    data_urls: list[str], prompt: str, model: str, api_key: str, max_tokens: int = 1000, json_mode: bool = False
+) -> str:
     if groq is None:
         raise RuntimeError("Falta librería groq (pip install groq).")
     client = groq.Client(api_key=api_key)
-    messages = [
-        {
-            "role": "user",
-            "content": [
-                {"type": "text", "text": prompt},
-                {"type": "image_url", "image_url": {"url": data_url}},
-            ],
-        }
-    ]
+    content = [{"type": "text", "text": prompt}]
+    for i, data_url in enumerate(data_urls, 1):
+        if len(data_urls) > 1:
+            content.append({"type": "text", "text": f"Imagen {i}:"})
+        content.append({"type": "image_url", "image_url": {"url": data_url}})
+    kwargs = {"response_format": {"type": "json_object"}} if json_mode else {}
     resp = client.chat.completions.create(
         model=model,
-        messages=messages,
+        messages=[{"role": "user", "content": content}],
         temperature=0.3,
         max_tokens=max_tokens,
+        **kwargs,
     )
     return (resp.choices[0].message.content or "").strip()
 
 
+def groq_chat_with_image(data_url: str, prompt: str, model: str, api_key: str, max_tokens: int = 1000) -> str:
+    return groq_chat_with_images([data_url], prompt, model=model, api_key=api_key, max_tokens=max_tokens)
+
+
+def animation_note(info: dict) -> str:
+    n = info.get("frames")
+    if not n:
+        return ""
+    return (
+        f"NOTA: la imagen es una animación (GIF/WebP). Te la paso como hoja de {n} fotogramas clave "
+        "numerados (#1, #2...) en orden temporal con su segundo; descríbela como una animación.\n"
+    )
+
+
 def prompt_for_mode(mode: str, user_prompt: str) -> str:
     base_rules = (
         "Responde en español. No inventes cosas que no puedas ver.\n"
@@ -162,14 +402,221 @@ def prompt_for_mode(mode: str, user_prompt: str) -> str:
     )
 
 
+# Tareas por modo cuando se piden varios modos/imágenes en una sola petición
+BATCH_TASKS = {
+    "describe": "describe la imagen (2-5 líneas) siguiendo la instrucción del usuario si la hay",
+    "ask": "responde la pregunta del usuario basándote SOLO en lo visible",
+    "ocr": "transcribe TODO el texto visible (incluye números y símbolos); si no hay, 'No se encontró texto visible.'",
+    "analyze": (
+        "objeto con description, main_objects (lista), style, mood, "
+        "contains_text (true/false) y notable_details (lista)"
+    ),
+}
+
+
+def batch_prompt(modes: list[str], user_prompt: str, n_images: int) -> str:
+    tasks = "\n".join(f'- "{m}": {BATCH_TASKS[m]}' for m in modes)
+    example = ", ".join(f'"{m}": ...' for m in modes)
+    return (
+        "Responde en español. No inventes cosas que no puedas ver.\n"
+        "No intentes identificar personas por nombre (no puedes saberlo con certeza).\n"
+        f"Te envío {n_images} imagen(es), numeradas en orden. Para CADA imagen haz estas tareas:\n"
+        f"{tasks}\n"
+        f"INSTRUCCIÓN DEL USUARIO: {user_prompt}\n\n"
+        "Responde SOLO con un JSON válido con esta forma:\n"
+        f'{{"images": [{{"index": 1, {example}}}]}}'
+    )
+
+
+def parse_batch_json(text: str) -> dict[int, dict]:
+    try:
+        data = json.loads(text)
+    except ValueError:
+        m = re.search(r"\{[\s\S]*\}", text or "")
+        data = json.loads(m.group(0)) if m else {}
+    out = {}
+    for item in (data.get("images") or []) if isinstance(data, dict) else []:
+        try:
+            out[int(item.get("index"))] = item
+        except (TypeError, ValueError):
+            continue
+    return out
+
+
+def _as_text(value) -> str:
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    return str(value or "").strip()
+
+
+def probe_image(img_bytes: bytes, mime: str) -> dict:
+    """
+    Sólo la cabecera (sin decodificar píxeles): tamaño original y si es una
+    animación. Basta para la clave de caché, así un acierto no paga prepare_image.
+    """
+    info = {"original_bytes": len(img_bytes), "mime": mime}
+    if Image is None:
+        return info
+    try:
+        with Image.open(BytesIO(img_bytes)) as img:
+            info["original_size"] = list(img.size)
+            info["animated"] = bool(getattr(img, "is_animated", False))
+    except Exception:
+        pass
+    return info
+
+
+def cache_mode(mode: str, animated: bool, frames: int) -> str:
+    # Animaciones: la hoja de contactos (y la respuesta) depende de --frames
+    return f"{mode}@{frames}f" if animated and frames > 1 else mode
+
+
+def group_pending(pending: list) -> list[list]:
+    """
+    Parte las imágenes pendientes en grupos de hasta MAX_IMAGES_PER_REQUEST
+    cuyos data URLs sumen como mucho MAX_REQUEST_BYTES. Una imagen que sola
+    ya pasa del presupuesto va en su propio grupo.
+    """
+    groups, group, size = [], [], 0
+    for item in pending:
+        item_size = len(item[1])
+        if group and (len(group) >= MAX_IMAGES_PER_REQUEST or size + item_size > MAX_REQUEST_BYTES):
+            groups.append(group)
+            group, size = [], 0
+        group.append(item)
+        size += item_size
+    if group:
+        groups.append(group)
+    return groups
+
+
+def run_batch(
+    sources: list[str], modes: list[str], user_prompt: str, timeout: int, key: str, model: str, frames: int = MAX_FRAMES
+) -> list[dict]:
+    """
+    Varias imágenes y/o varios modos: descarga y preprocesa en paralelo,
+    resuelve lo que haya en caché y empaqueta el resto en el mínimo de
+    peticiones (ver group_pending; todos los modos a la vez).
+    Devuelve un resultado por imagen: {"src", "ok", "results": {modo: {...}}}.
+    """
+    cache = open_cache()
+    results = [{"src": source_label(src, i), "ok": False, "results": {}} for i, src in enumerate(sources)]
+
+    def load(index: int):
+        src = sources[index]
+        img, mime_or_err = load_image_bytes(src, timeout=timeout)
+        if img is None:
+            return index, None, f"No pude cargar imagen: {mime_or_err}"
+        # La huella perceptual sólo se calcula si algún modo la necesita (ver ImageResultCache.get)
+        hashes = (content_hash(img), lru_cache(maxsize=1)(partial(fingerprint, img))) if cache is not None else (None, None)
+        # El lado máximo más exigente entre los modos pedidos
+        prep_mode = "ocr" if "ocr" in modes else modes[0]
+        data, mime, info = prepare_image(img, mime_or_err, prep_mode, frames)
+        return index, (to_data_url(data, mime), info, hashes), None
+
+    with ThreadPoolExecutor(max_workers=max(1, BATCH_WORKERS)) as pool:
+        loaded = list(pool.map(load, range(len(sources))))
+
+    pending = []
+    for index, payload, error in loaded:
+        if payload is None:
+            results[index]["error"] = error
+            continue
+        data_url, info, (sha, phash) = payload
+        results[index]["image"] = info
+        missing = []
+        for mode in modes:
+            cached = None
+            if cache is not None and sha:
+                try:
+                    cached, hit = cache.get(sha, phash, cache_mode(mode, bool(info.get("frames")), frames), user_prompt, model)
+                except Exception as e:
+                    eprint("[image_bridge] cache:", repr(e))
+            if cached:
+                results[index]["results"][mode] = {"ok": True, "text": cached, "cached": hit}
+            else:
+                missing.append(mode)
+        if missing:
+            pending.append((index, data_url, sha, phash, missing))
+        else:
+            results[index]["ok"] = True
+
+    groups = group_pending(pending)
+
+    def ask(group):
+        group_modes = [m for m in modes if any(m in item[4] for item in group)]
+        if len(group) == 1 and len(group_modes) == 1:
+            mode = group_modes[0]
+            prompt = animation_note(results[group[0][0]]["image"]) + prompt_for_mode(mode, user_prompt)
+            text = groq_chat_with_image(group[0][1], prompt, model=model, api_key=key)
+            return group, {1: {mode: text}}
+        prompt = batch_prompt(group_modes, user_prompt, len(group))
+        animated = [str(pos) for pos, item in enumerate(group, 1) if results[item[0]]["image"].get("frames")]
+        if animated:
+            prompt = (
+                f"NOTA: la(s) imagen(es) {', '.join(animated)} son animaciones (GIF/WebP) enviadas como hoja "
+                "de fotogramas clave numerados (#1, #2...) en orden temporal con su segundo.\n"
+            ) + prompt
+        max_tokens = min(8192, 700 * len(group) * len(group_modes))
+        text = groq_chat_with_images(
+            [item[1] for item in group], prompt, model=model, api_key=key, max_tokens=max_tokens, json_mode=True
+        )
+        return group, parse_batch_json(text)
+
+    with ThreadPoolExecutor(max_workers=max(1, BATCH_WORKERS)) as pool:
+        futures = [pool.submit(ask, group) for group in groups]
+        for future, group in zip(futures, groups):
+            try:
+                _, parsed = future.result()
+            except Exception as e:
+                eprint("[image_bridge] EXCEPTION:", repr(e))
+                for index, *_ in group:
+                    results[index]["error"] = str(e)
+                continue
+            for pos, (index, _, sha, phash, missing) in enumerate(group, 1):
+                item = parsed.get(pos, {})
+                for mode in missing:
+                    text = _as_text(item.get(mode))
+                    if not text:
+                        results[index]["results"][mode] = {"ok": False, "error": "Respuesta vacía del modelo"}
+                        continue
+                    results[index]["results"][mode] = {"ok": True, "text": text}
+                    if cache is not None and sha:
+                        try:
+                            cache.put(
+                                sha, phash, cache_mode(mode, bool(results[index]["image"].get("frames")), frames),
+                                user_prompt, model, text,
+                            )
+                        except Exception as e:
+                            eprint("[image_bridge] cache:", repr(e))
+
+    for r in results:
+        if r["results"]:
+            r["ok"] = any(v.get("ok") for v in r["results"].values())
+    return results
+
+
 def main():
     ap = argparse.ArgumentParser()
-    ap.add_argument("mode", choices=["describe", "ask", "ocr", "analyze"])
-    ap.add_argument("--src", required=True, help="URL o path local de imagen")
+    ap.add_argument("mode", choices=MODES + ["batch"])
+    ap.add_argument(
+        "--src", action="append", required=True,
+        help="URL, path local, '-' (frame por stdin) o fd:N (repetible)",
+    )
+    ap.add_argument("--modes", default="", help="Modos separados por coma (batch), ej: describe,ocr")
     ap.add_argument("--prompt", default="", help="Prompt/pregunta del usuario")
     ap.add_argument("--timeout", type=int, default=15)
+    ap.add_argument("--frames", type=int, default=MAX_FRAMES, help="Fotogramas clave para GIF/WebP animados")
     args = ap.parse_args()
 
+    modes = [m.strip() for m in args.modes.split(",") if m.strip()] if args.modes else []
+    if args.mode != "batch" and args.mode not in modes:
+        modes.insert(0, args.mode)
+    bad = [m for m in modes if m not in MODES]
+    if bad or not modes:
+        print(json.dumps({"ok": False, "error": f"Modos inválidos: {', '.join(bad) or '(ninguno)'}"}, ensure_ascii=False))
+        return 2
+
     key = env_key()
     model = env_model()
 
@@ -177,20 +624,59 @@ def main():
         print(json.dumps({"ok": False, "error": "Falta GROQ_IMAGE_API_KEY o GROQ_API_KEY"}, ensure_ascii=False))
         return 2
 
-    img, mime_or_err = load_image_bytes(args.src, timeout=args.timeout)
+    try:
+        args.src = resolve_inline_sources(args.src)
+    except (OSError, ValueError, EOFError) as e:
+        print(json.dumps({"ok": False, "error": f"No pude leer imagen inline: {e}"}, ensure_ascii=False))
+        return 2
+
+    if args.mode == "batch" or len(args.src) > 1 or len(modes) > 1:
+        results = run_batch(args.src, modes, args.prompt or "", args.timeout, key, model, args.frames)
+        ok = any(r["ok"] for r in results)
+        out = {"ok": ok, "results": results}
+        if not ok:
+            out["error"] = next((r.get("error") for r in results if r.get("error")), "Ninguna imagen pudo analizarse")
+        print(json.dumps(out, ensure_ascii=False))
+        return 0 if ok else 2
+
+    img, mime_or_err = load_image_bytes(args.src[0], timeout=args.timeout)
     if img is None:
         print(json.dumps({"ok": False, "error": f"No pude cargar imagen: {mime_or_err}"}, ensure_ascii=False))
         return 2
 
-    data_url = to_data_url(img, mime_or_err)
-    prompt = prompt_for_mode(args.mode, args.prompt or "")
+    # Caché por sha (y huella perceptual en describe/analyze): memes/capturas repetidas no gastan cuota.
+    # La clave sale de la cabecera; prepare_image sólo si hay que llamar al modelo.
+    cache = open_cache()
+    sha = phash = None
+    key_mode = args.mode
+    if cache is not None:
+        try:
+            probe = probe_image(img, mime_or_err)
+            key_mode = cache_mode(args.mode, probe.get("animated", False), args.frames)
+            sha, phash = content_hash(img), lru_cache(maxsize=1)(partial(fingerprint, img))
+            cached, hit = cache.get(sha, phash, key_mode, args.prompt or "", model)
+            if cached:
+                probe.pop("animated", None)
+                print(json.dumps({"ok": True, "text": cached, "cached": hit, "image": probe}, ensure_ascii=False))
+                return 0
+        except Exception as e:
+            eprint("[image_bridge] cache:", repr(e))
+
+    img, mime, img_info = prepare_image(img, mime_or_err, args.mode, args.frames)
+    data_url = to_data_url(img, mime)
+    prompt = animation_note(img_info) + prompt_for_mode(args.mode, args.prompt or "")
 
     try:
         out = groq_chat_with_image(data_url, prompt, model=model, api_key=key, max_tokens=1000)
         if not out:
             print(json.dumps({"ok": False, "error": "Respuesta vacía del modelo"}, ensure_ascii=False))
             return 2
-        print(json.dumps({"ok": True, "text": out}, ensure_ascii=False))
+        if cache is not None and sha:
+            try:
+                cache.put(sha, phash, key_mode, args.prompt or "", model, out)
+            except Exception as e:
+                eprint("[image_bridge] cache:", repr(e))
+        print(json.dumps({"ok": True, "text": out, "image": img_info}, ensure_ascii=False))
         return 0
     except Exception as e:
         eprint("[image_bridge] EXCEPTION:", repr(e))
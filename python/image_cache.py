@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+Caché de resultados de image_bridge (describe/ask/ocr/analyze).
+
+Clave: sha256 del contenido + modo + prompt normalizado + modelo, y para
+describe/analyze además una huella perceptual (dHash 16x16 = 256 bits, más
+brillo y contraste medios) que aguanta recompresión y cambios de tamaño.
+
+- Primero se busca coincidencia exacta por sha256.
+- ocr y ask sólo aceptan coincidencia exacta: dos capturas de chat con el
+  mismo diseño tienen huellas casi iguales aunque el texto sea otro.
+- describe/analyze buscan por distancia de Hamming con multi-index hashing:
+  el dHash se parte en 16 bandas de 16 bits indexadas en SQLite; dos hashes
+  a distancia <= 15 comparten al menos una banda (palomar), así que basta
+  con pedir los candidatos que coinciden en alguna banda y medir la
+  distancia. Además brillo y contraste tienen que parecerse, y las imágenes
+  casi planas (sin detalle, el dHash no las distingue) no entran.
+- Las entradas caducan por TTL y se desalojan las menos usadas por tamaño.
+"""
+import hashlib
+import os
+import re
+import sqlite3
+import tempfile
+import time
+from io import BytesIO
+from typing import Optional
+
+try:
+    from PIL import Image, ImageOps
+except Exception:
+    Image = None
+    ImageOps = None
+
+CACHE_ENABLED = os.getenv("IMAGE_CACHE", "1") not in ("0", "false", "no")
+CACHE_PATH = os.getenv("IMAGE_CACHE_PATH", os.path.join(tempfile.gettempdir(), "ceniza_image_cache.sqlite"))
+CACHE_TTL = int(os.getenv("IMAGE_CACHE_TTL", str(7 * 24 * 3600)))
+CACHE_MAX_ENTRIES = int(os.getenv("IMAGE_CACHE_MAX_ENTRIES", "5000"))
+
+# Modos que aceptan reutilizar la respuesta de una imagen "parecida"
+PERCEPTUAL_MODES = {"describe", "analyze"}
+
+HASH_SIDE = 16
+HASH_BITS = HASH_SIDE * HASH_SIDE
+# Distancia máxima sobre 256 bits (< BANDS para que valga el palomar).
+# Medido: fotos recomprimidas/reescaladas <= 3; capturas oscuras de poco
+# contraste recomprimidas hasta ~15 (ahí se falla a propósito: un fallo sólo
+# cuesta una llamada), capturas de chat distintas con el mismo diseño >= 27.
+MAX_DISTANCE = 10
+# Diferencia máxima de brillo/contraste medios (0-255)
+MAX_TONE_DELTA = 16
+# Por debajo de este contraste la imagen es casi plana: sólo caché exacta
+MIN_CONTRAST = 6
+
+BANDS = 16
+BAND_BITS = HASH_BITS // BANDS
+BAND_MASK = (1 << BAND_BITS) - 1
+
+
+def normalize_prompt(prompt: str) -> str:
+    p = re.sub(r"\s+", " ", (prompt or "").strip().lower())
+    return p.strip(" .!?¿¡")
+
+
+def fingerprint(img_bytes: bytes) -> Optional[tuple[int, int, int]]:
+    """(dHash 256 bits, brillo medio, contraste) o None si no aplica."""
+    if Image is None:
+        return None
+    try:
+        img = Image.open(BytesIO(img_bytes))
+        # Animaciones: el primer fotograma no las representa; sólo caché exacta
+        if getattr(img, "is_animated", False):
+            return None
+        if img.format == "JPEG":
+            img.draft("L", (HASH_SIDE * 8, HASH_SIDE * 8))
+        img = ImageOps.exif_transpose(img).convert("L").resize((HASH_SIDE + 1, HASH_SIDE), Image.LANCZOS)
+    except Exception:
+        return None
+    px = img.tobytes()
+    n = len(px)
+    luma = sum(px) / n
+    contrast = (sum((p - luma) ** 2 for p in px) / n) ** 0.5
+    if contrast < MIN_CONTRAST:
+        return None
+    value = 0
+    for row in range(HASH_SIDE):
+        base = row * (HASH_SIDE + 1)
+        for col in range(HASH_SIDE):
+            value = (value << 1) | (px[base + col] > px[base + col + 1])
+    return value, int(round(luma)), int(round(contrast))
+
+
+def _bands(h: int) -> list[int]:
+    # Banda i en los 16 bits altos para que el valor sea único entre bandas
+    return [(i << BAND_BITS) | ((h >> (i * BAND_BITS)) & BAND_MASK) for i in range(BANDS)]
+
+
+class ImageResultCache:
+    def __init__(self, path: str = CACHE_PATH):
+        self.db = sqlite3.connect(path, timeout=5)
+        # Esquema anterior (dHash de 64 bits): no distinguía capturas con texto
+        self.db.execute("DROP TABLE IF EXISTS results")
+        self.db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS entries (
+                id INTEGER PRIMARY KEY,
+                sha TEXT NOT NULL,
+                phash TEXT,
+                luma INTEGER,
+                contrast INTEGER,
+                mode TEXT NOT NULL,
+                prompt TEXT NOT NULL,
+                model TEXT NOT NULL,
+                text TEXT NOT NULL,
+                created REAL NOT NULL,
+                used REAL NOT NULL,
+                UNIQUE (sha, mode, prompt, model)
+            )
+            """
+        )
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS entry_bands (entry_id INTEGER NOT NULL, band INTEGER NOT NULL)"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS entry_bands_band ON entry_bands (band)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS entry_bands_entry ON entry_bands (entry_id)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS entries_used ON entries (used)")
+        self.db.commit()
+
+    def get(self, sha: str, fp, mode: str, prompt: str, model: str) -> tuple[Optional[str], str]:
+        """
+        Devuelve (texto, "exact" | "perceptual") o (None, "").
+        `fp` puede ser la huella o una función que la calcula: sólo se llama
+        si no hubo acierto exacto y el modo admite coincidencia perceptual.
+        """
+        now = time.time()
+        prompt = normalize_prompt(prompt)
+        min_created = now - CACHE_TTL
+
+        row = self.db.execute(
+            "SELECT id, text FROM entries WHERE sha=? AND mode=? AND prompt=? AND model=? AND created>=?",
+            (sha, mode, prompt, model, min_created),
+        ).fetchone()
+        if row:
+            self._touch(row[0], now)
+            return row[1], "exact"
+
+        if mode not in PERCEPTUAL_MODES:
+            return None, ""
+        if callable(fp):
+            fp = fp()
+        if fp is None:
+            return None, ""
+        phash, luma, contrast = fp
+        bands = _bands(phash)
+        rows = self.db.execute(
+            f"SELECT DISTINCT e.id, e.phash, e.luma, e.contrast, e.text FROM entry_bands b "
+            f"JOIN entries e ON e.id = b.entry_id "
+            f"WHERE b.band IN ({','.join('?' * BANDS)}) AND e.mode=? AND e.prompt=? AND e.model=? AND e.created>=?",
+            (*bands, mode, prompt, model, min_created),
+        ).fetchall()
+        best = None
+        for entry_id, cand_hash, cand_luma, cand_contrast, text in rows:
+            if abs(cand_luma - luma) > MAX_TONE_DELTA or abs(cand_contrast - contrast) > MAX_TONE_DELTA:
+                continue
+            dist = bin(int(cand_hash, 16) ^ phash).count("1")
+            if dist <= MAX_DISTANCE and (best is None or dist < best[0]):
+                best = (dist, entry_id, text)
+        if best is None:
+            return None, ""
+        self._touch(best[1], now)
+        return best[2], "perceptual"
+
+    def put(self, sha: str, fp, mode: str, prompt: str, model: str, text: str) -> None:
+        now = time.time()
+        if mode not in PERCEPTUAL_MODES:
+            fp = None
+        elif callable(fp):
+            fp = fp()
+        phash, luma, contrast = fp if fp is not None else (None, None, None)
+        cur = self.db.execute(
+            "INSERT OR REPLACE INTO entries (sha, phash, luma, contrast, mode, prompt, model, text, created, used) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (sha, f"{phash:064x}" if phash is not None else None, luma, contrast,
+             mode, normalize_prompt(prompt), model, text, now, now),
+        )
+        if phash is not None:
+            self.db.executemany(
+                "INSERT INTO entry_bands (entry_id, band) VALUES (?, ?)",
+                [(cur.lastrowid, b) for b in _bands(phash)],
+            )
+        self._evict(now)
+        self.db.commit()
+
+    def _touch(self, entry_id: int, now: float) -> None:
+        self.db.execute("UPDATE entries SET used=? WHERE id=?", (now, entry_id))
+        self.db.commit()
+
+    def _evict(self, now: float) -> None:
+        self.db.execute("DELETE FROM entries WHERE created<?", (now - CACHE_TTL,))
+        self.db.execute(
+            "DELETE FROM entries WHERE id IN ("
+            "SELECT id FROM entries ORDER BY used DESC LIMIT -1 OFFSET ?)",
+            (CACHE_MAX_ENTRIES,),
+        )
+        # Bandas de entradas borradas o reemplazadas (INSERT OR REPLACE cambia el id)
+        self.db.execute("DELETE FROM entry_bands WHERE entry_id NOT IN (SELECT id FROM entries)")
+
+
+def open_cache() -> Optional[ImageResultCache]:
+    if not CACHE_ENABLED:
+        return None
+    try:
+        return ImageResultCache()
+    except sqlite3.Error:
+        return None
+
+
+def content_hash(img_bytes: bytes) -> str:
+    return hashlib.sha256(img_bytes).hexdigest()
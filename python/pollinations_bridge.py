@@ -3,11 +3,18 @@ import argparse
 import json
 import os
 import random
+import struct
+import sys
+import tempfile
 import time
 import urllib.parse
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeout, as_completed
+from functools import lru_cache
+from io import BytesIO
 from urllib.parse import urlparse
 
-import requests
+from generation_cache import cache_key, open_cache, single_flight
+from http_download import DownloadError, fetch
 
 # Watermark
 from PIL import Image, ImageDraw, ImageFont
@@ -22,6 +29,33 @@ DEFAULT_HEADERS = {
 
 # Umbral mínimo razonable: pollinations puede devolver imágenes válidas <50KB
 MIN_IMAGE_BYTES = int(os.getenv("POLLINATIONS_MIN_BYTES", "4000"))  # 4KB default
+# Tope de descarga (2048x2048 PNG ronda 8-12MB)
+MAX_IMAGE_BYTES = int(os.getenv("POLLINATIONS_MAX_BYTES", str(40 * 1024 * 1024)))
+
+# Salida del watermark: png (compress_level configurable, sin optimize) o webp sin pérdidas
+OUTPUT_FORMAT = os.getenv("POLLINATIONS_OUTPUT_FORMAT", "png").lower()
+PNG_COMPRESS_LEVEL = int(os.getenv("POLLINATIONS_PNG_COMPRESS_LEVEL", "3"))
+PNG_OPTIMIZE = os.getenv("POLLINATIONS_PNG_OPTIMIZE", "0") in ("1", "true", "yes")
+
+# Salida hacia node:
+# - frame: [uint32 BE largo][JSON] + [uint32 BE largo][bytes de la imagen] por stdout
+# - file: sólo JSON con la ruta; los archivos viven en TMP_DIR y se purgan por edad
+# - base64: JSON con buffer_base64 + file (compatibilidad)
+OUTPUT_MODES = ["frame", "file", "base64"]
+TMP_DIR = os.getenv("POLLINATIONS_TMP_DIR", os.path.join(tempfile.gettempdir(), "ceniza_poll"))
+TMP_TTL = int(os.getenv("POLLINATIONS_TMP_TTL", "3600"))
+FRAME_HEADER = struct.Struct(">I")
+
+# --variants: varias seeds/modelos en paralelo + cuadrícula de vista previa
+MAX_VARIANTS = int(os.getenv("POLLINATIONS_MAX_VARIANTS", "4"))
+VARIANT_WORKERS = int(os.getenv("POLLINATIONS_VARIANT_WORKERS", "4"))
+VARIANT_TIMEOUT = float(os.getenv("POLLINATIONS_VARIANT_TIMEOUT", "150"))
+GRID_CELL = int(os.getenv("POLLINATIONS_GRID_CELL", "512"))
+
+FONT_CANDIDATES = [
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf",
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+]
 
 
 def jprint(obj):
@@ -38,17 +72,11 @@ def is_http(url: str) -> bool:
 
 
 def req_get(url, params=None, timeout=140):
-    # 1) sin headers
-    try:
-        r = requests.get(url, params=params, timeout=timeout, allow_redirects=True)
-        r.raise_for_status()
-        return r
-    except Exception:
-        pass
-    # 2) con headers
-    r = requests.get(url, params=params, headers=DEFAULT_HEADERS, timeout=timeout, allow_redirects=True)
-    r.raise_for_status()
-    return r
+    """
+    Descarga con tope de bytes y reintento con headers sólo ante 403/etc.
+    Devuelve (bytes, mime, headers).
+    """
+    return fetch(url, params=params, timeout=timeout, max_bytes=MAX_IMAGE_BYTES, retry_headers=DEFAULT_HEADERS)
 
 
 def build_pollinations_url(prompt: str) -> str:
@@ -68,103 +96,165 @@ def pick_key(model_id: str) -> str:
 
 def _tmp_name(prefix: str = "ceniza_poll", ext: str = "png") -> str:
     ts = int(time.time())
-    rnd = random.randint(1000, 9999)
-    return os.path.join("/tmp", f"{prefix}_{ts}_{rnd}.{ext}")
+    rnd = f"{random.getrandbits(32):08x}"  # varias salidas por proceso con --variants
+    os.makedirs(TMP_DIR, exist_ok=True)
+    return os.path.join(TMP_DIR, f"{prefix}_{ts}_{rnd}.{ext}")
 
 
-def add_watermark_png(png_bytes: bytes, text: str = "CenizaGPT") -> bytes:
+def cleanup_tmp(max_age: int = TMP_TTL) -> None:
+    # Borra las salidas viejas que node ya no va a leer
+    try:
+        entries = os.scandir(TMP_DIR)
+    except OSError:
+        return
+    limit = time.time() - max_age
+    with entries:
+        for entry in entries:
+            try:
+                if entry.is_file() and entry.stat().st_mtime < limit:
+                    os.remove(entry.path)
+            except OSError:
+                pass
+
+
+def write_frame(stream, payload: bytes) -> None:
+    stream.write(FRAME_HEADER.pack(len(payload)))
+    stream.write(payload)
+
+
+def write_output(result: dict, blobs: list, output: str) -> int:
     """
-    Añade watermark abajo-derecha:
-    - opacidad suave
-    - sombra para legibilidad
-    - tamaño proporcional al ancho
+    Emite el resultado según --output. `blobs` es [(dict destino, bytes)]:
+    cada dict destino (el propio result, una variante, la cuadrícula) recibe
+    "frame" (índice del frame tras la cabecera) o "file"/"buffer_base64".
+    Siempre devuelve 0 (igual que jprint).
     """
-    from io import BytesIO
+    if output == "frame":
+        for i, (target, data) in enumerate(blobs):
+            target["frame"] = i
+            target["bytes"] = len(data)
+        out = sys.stdout.buffer
+        write_frame(out, json.dumps(result, ensure_ascii=False).encode("utf-8"))
+        for _, data in blobs:
+            write_frame(out, data)
+        out.flush()
+        return 0
+
+    if blobs:
+        cleanup_tmp()
+    for target, data in blobs:
+        out_path = _tmp_name(prefix="ceniza_poll", ext=target.get("ext") or "png")
+        with open(out_path, "wb") as f:
+            f.write(data)
+        target["file"] = out_path
 
-    img = Image.open(BytesIO(png_bytes)).convert("RGBA")
-    w, h = img.size
+        if output == "base64":
+            # buffer_base64 para que node no dependa del filesystem
+            import base64
+            target["buffer_base64"] = base64.b64encode(data).decode("ascii")
 
-    overlay = Image.new("RGBA", img.size, (0, 0, 0, 0))
-    draw = ImageDraw.Draw(overlay)
+    return jprint(result)
 
-    font_size = max(18, int(w * 0.045))
-    margin = max(12, int(w * 0.02))
 
-    font = None
-    font_candidates = [
-        "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf",
-        "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
-    ]
-    for fp in font_candidates:
+@lru_cache(maxsize=1)
+def _font_path():
+    for fp in FONT_CANDIDATES:
         if os.path.exists(fp):
-            try:
-                font = ImageFont.truetype(fp, font_size)
-                break
-            except Exception:
-                pass
-    if font is None:
-        font = ImageFont.load_default()
+            return fp
+    return None
+
+
+@lru_cache(maxsize=16)
+def _load_font(font_size: int):
+    fp = _font_path()
+    if fp:
+        try:
+            return ImageFont.truetype(fp, font_size)
+        except Exception:
+            pass
+    return ImageFont.load_default()
+
 
-    bbox = draw.textbbox((0, 0), text, font=font)
+@lru_cache(maxsize=16)
+def _watermark_stamp(text: str, font_size: int):
+    """
+    Renderiza una sola vez (por texto y tamaño) el sello con sus sombras en
+    un RGBA del tamaño justo. Devuelve (sello, ancho_texto, alto_texto, dx, dy):
+    dx/dy es dónde cae dentro del sello el origen del texto principal.
+    """
+    font = _load_font(font_size)
+    probe = ImageDraw.Draw(Image.new("RGBA", (1, 1)))
+    bbox = probe.textbbox((0, 0), text, font=font)
     tw = bbox[2] - bbox[0]
     th = bbox[3] - bbox[1]
 
-    x = w - tw - margin
-    y = h - th - margin
-
     shadow_offset = max(2, int(font_size * 0.08))
-    shadow_color = (0, 0, 0, 160)
-    text_color = (255, 255, 255, 210)
+    pad = 2
+    # El texto puede tener bbox con origen negativo/positivo: lo compensamos
+    dx, dy = pad - bbox[0], pad - bbox[1]
+    stamp = Image.new("RGBA", (tw + shadow_offset + pad * 2, th + shadow_offset + pad * 2), (0, 0, 0, 0))
 
-    draw.text((x + shadow_offset, y + shadow_offset), text, font=font, fill=shadow_color)
-    draw.text((x + shadow_offset // 2, y + shadow_offset // 2), text, font=font, fill=(0, 0, 0, 120))
-    draw.text((x, y), text, font=font, fill=text_color)
+    # Mismas capas que antes: sombra, media sombra y texto
+    draw = ImageDraw.Draw(stamp)
+    draw.text((dx + shadow_offset, dy + shadow_offset), text, font=font, fill=(0, 0, 0, 160))
+    draw.text((dx + shadow_offset // 2, dy + shadow_offset // 2), text, font=font, fill=(0, 0, 0, 120))
+    draw.text((dx, dy), text, font=font, fill=(255, 255, 255, 210))
+    return stamp, tw, th, dx, dy
 
-    out = Image.alpha_composite(img, overlay).convert("RGBA")
 
+def encode_output(img, fmt: str = OUTPUT_FORMAT) -> tuple[bytes, str]:
     buf = BytesIO()
-    out.save(buf, format="PNG", optimize=True)
-    return buf.getvalue()
+    if fmt == "webp":
+        img.save(buf, format="WEBP", lossless=True, quality=50, method=2)
+        return buf.getvalue(), "webp"
+    img.save(buf, format="PNG", compress_level=PNG_COMPRESS_LEVEL, optimize=PNG_OPTIMIZE)
+    return buf.getvalue(), "png"
 
 
-def main():
-    ap = argparse.ArgumentParser()
-    ap.add_argument("mode", choices=["generate", "edit"])
-    ap.add_argument("--prompt", required=True)
-    ap.add_argument("--model", default=os.getenv("POLLINATIONS_MODEL_FLUX", "flux"))
-    ap.add_argument("--seed", type=int, default=0)
-    ap.add_argument("--width", type=int, default=1024)
-    ap.add_argument("--height", type=int, default=1024)
-    ap.add_argument("--quality", default="medium")
-    ap.add_argument("--safe", default="false")
-    ap.add_argument("--enhance", default="true")
-    ap.add_argument("--nologo", default="true")
-    ap.add_argument("--image", default="")  # base image url for edit
-    ap.add_argument("--watermark", default="CenizaGPT")
-    args = ap.parse_args()
+def add_watermark(img_bytes: bytes, text: str = "CenizaGPT", fmt: str = OUTPUT_FORMAT) -> tuple[bytes, str]:
+    """
+    Añade watermark abajo-derecha (misma apariencia que siempre):
+    - opacidad suave
+    - sombra para legibilidad
+    - tamaño proporcional al ancho
+    Sólo se compone la caja del sello, sobre la imagen decodificada.
+    Devuelve (bytes, extensión).
+    """
+    img = Image.open(BytesIO(img_bytes))
+    if img.mode not in ("RGB", "RGBA"):
+        img = img.convert("RGBA" if "A" in img.getbands() or "transparency" in img.info else "RGB")
+    w, h = img.size
 
-    prompt = (args.prompt or "").strip()
-    model_id = (args.model or "").strip() or os.getenv("POLLINATIONS_MODEL_FLUX", "flux")
-    seed = args.seed if args.seed and args.seed > 0 else random.randint(1, 9999999)
+    font_size = max(18, int(w * 0.045))
+    margin = max(12, int(w * 0.02))
+    stamp, tw, th, ox, oy = _watermark_stamp(text, font_size)
 
-    if not prompt:
-        return jprint({"ok": False, "error": "Prompt vacío."})
+    # Posición del texto principal igual que el algoritmo original
+    x = w - tw - margin - ox
+    y = h - th - margin - oy
 
-    key = pick_key(model_id)
-    if not key:
-        return jprint({"ok": False, "error": f"Falta API key para model={model_id} (revisa .env)"})
+    if img.mode == "RGBA":
+        # alpha_composite con dest respeta la transparencia del fondo
+        sx, sy = max(0, -x), max(0, -y)
+        img.alpha_composite(stamp, dest=(max(0, x), max(0, y)), source=(sx, sy))
+    else:
+        # Fondo opaco: paste con la alfa del sello como máscara es la misma mezcla
+        img.paste(stamp, (x, y), stamp)
 
+    return encode_output(img, fmt)
 
-    if args.mode == "edit":
-        if not args.image or not is_http(args.image):
-            return jprint({"ok": False, "error": "Para editar necesitas --image con URL válida."})
 
-    url = build_pollinations_url(prompt)
+def add_watermark_png(png_bytes: bytes, text: str = "CenizaGPT") -> bytes:
+    return add_watermark(png_bytes, text=text, fmt="png")[0]
 
-    # clamp sizes
-    width = max(256, min(2048, int(args.width or 1024)))
-    height = max(256, min(2048, int(args.height or 1024)))
 
+def generate_one(args, model_id: str, seed: int, width: int, height: int) -> tuple[dict, object]:
+    """Pide una imagen y le pone el watermark. Devuelve (resultado, bytes o None)."""
+    key = pick_key(model_id)
+    if not key:
+        return {"ok": False, "error": f"Falta API key para model={model_id} (revisa .env)"}, None
+
+    url = build_pollinations_url(args.prompt)
     params = {
         "model": model_id,
         "width": str(width),
@@ -180,49 +270,255 @@ def main():
         params["image"] = args.image
 
     try:
-        resp = req_get(url, params=params, timeout=140)
-        ctype = (resp.headers.get("content-type") or "").lower()
+        try:
+            data, ctype, _ = req_get(url, params=params, timeout=140)
+        except DownloadError as e:
+            detail = f" {e.body[:400]}" if e.body else ""
+            return {"ok": False, "error": f"{e}{detail}"}, None
 
         if "image" not in ctype:
-            txt = resp.text[:400] if resp.text else ""
-            return jprint({"ok": False, "error": f"Respuesta no-imagen (ctype={ctype}): {txt}"})
+            txt = data[:400].decode("utf-8", errors="replace")
+            return {"ok": False, "error": f"Respuesta no-imagen (ctype={ctype}): {txt}"}, None
 
-        data = resp.content or b""
         if len(data) < MIN_IMAGE_BYTES:
-            return jprint({
+            return {
                 "ok": False,
                 "error": f"Imagen demasiado pequeña ({len(data)} bytes). Posible error/saldo/bloqueo.",
                 "min_bytes": MIN_IMAGE_BYTES,
                 "ctype": ctype,
-            })
+            }, None
 
         # ✅ Watermark siempre (si falla, seguimos con original)
+        ext = "png" if "png" in ctype else "jpg" if "jpeg" in ctype else "webp" if "webp" in ctype else "png"
         try:
-            data = add_watermark_png(data, text=args.watermark or "CenizaGPT")
+            data, ext = add_watermark(data, text=args.watermark or "CenizaGPT", fmt=args.out_format)
         except Exception:
             pass
 
-        out_path = _tmp_name(prefix="ceniza_poll", ext="png")
-        with open(out_path, "wb") as f:
-            f.write(data)
-
-        # buffer_base64 para que node no dependa del filesystem
-        import base64
-        b64 = base64.b64encode(data).decode("ascii")
-
-        return jprint({
+        return {
             "ok": True,
-            "file": out_path,
-            "buffer_base64": b64,
             "seed": seed,
             "model": model_id,
             "width": width,
             "height": height,
             "mode": args.mode,
-        })
+            "ext": ext,
+        }, data
+
+    except Exception as e:
+        return {"ok": False, "error": str(e)}, None
+
+
+def generation_key(args, model_id: str, seed: int, width: int, height: int) -> str:
+    return cache_key(
+        args.prompt, model_id, seed, width, height,
+        args.quality, args.enhance, args.safe, args.nologo,
+        image=args.image if args.mode == "edit" else "",
+        watermark=args.watermark or "CenizaGPT",
+        fmt=args.out_format,
+    )
+
+
+def cached_only(args, model_id: str, seed: int, width: int, height: int) -> tuple[dict, object]:
+    """
+    --cache-only: sólo mira la caché, nunca llama a Pollinations. Node lo usa
+    antes de comprobar/descontar cupos, para que un acierto no cuente.
+    """
+    cache = open_cache()
+    hit = None
+    if cache is not None:
+        try:
+            hit = cache.get(generation_key(args, model_id, seed, width, height))
+        finally:
+            cache.close()
+    if hit is None:
+        return {"ok": False, "error": "cache_miss", "cache_miss": True}, None
+    data, meta = hit
+    return {**meta, "mode": args.mode, "cached": True}, data
+
+
+def generate_cached(args, model_id: str, seed: int, width: int, height: int) -> tuple[dict, object]:
+    """
+    generate_one con caché determinista y single-flight: si otro proceso ya
+    está pidiendo exactamente lo mismo, esperamos y leemos su resultado.
+    El resultado lleva "cached" para que node no descuente cupo en un acierto.
+    """
+    cache = None if args.no_cache else open_cache()
+    if cache is None:
+        result, data = generate_one(args, model_id, seed, width, height)
+        result["cached"] = False
+        return result, data
+
+    key = generation_key(args, model_id, seed, width, height)
+    try:
+        hit = cache.get(key)
+        if hit is None:
+            with single_flight(key):
+                hit = cache.get(key)
+                if hit is None:
+                    result, data = generate_one(args, model_id, seed, width, height)
+                    if result.get("ok") and data is not None:
+                        cache.put(key, data, result)
+                    result["cached"] = False
+                    return result, data
+        data, meta = hit
+        return {**meta, "mode": args.mode, "cached": True}, data
+    finally:
+        cache.close()
+
+
+def variant_plan(args, model_id: str, seed: int) -> list[tuple[str, int]]:
+    """(modelo, seed) por variante: --models da un modelo por variante con la misma seed; si no, seeds consecutivas."""
+    models = [m.strip() for m in (args.models or "").split(",") if m.strip()]
+    if models:
+        return [(m, seed) for m in models[:MAX_VARIANTS]]
+    n = max(1, min(MAX_VARIANTS, args.variants))
+    return [(model_id, seed + i) for i in range(n)]
+
+
+def compose_grid(variants: list, items: dict, fmt: str) -> tuple[bytes, str, int, int]:
+    """
+    Cuadrícula de vista previa: una celda por variante (miniatura + etiqueta
+    "#n · seed/modelo"); las que fallaron salen como celda gris.
+    `items` es {índice: bytes} de las que salieron bien.
+    """
+    n = len(variants)
+    cols = 1 if n == 1 else 2 if n <= 4 else 3
+    rows = (n + cols - 1) // cols
+    font_size = max(14, GRID_CELL // 24)
+    font = _load_font(font_size)
+    label_h = font_size + 12
+
+    grid = Image.new("RGB", (cols * GRID_CELL, rows * (GRID_CELL + label_h)), (24, 24, 28))
+    draw = ImageDraw.Draw(grid)
+    for pos, v in enumerate(variants):
+        x = (pos % cols) * GRID_CELL
+        y = (pos // cols) * (GRID_CELL + label_h)
+        data = items.get(v["index"])
+        if data is not None:
+            with Image.open(BytesIO(data)) as im:
+                im.draft("RGB", (GRID_CELL, GRID_CELL))
+                thumb = im.convert("RGB")
+                thumb.thumbnail((GRID_CELL, GRID_CELL), Image.BILINEAR)
+            grid.paste(thumb, (x + (GRID_CELL - thumb.width) // 2, y + (GRID_CELL - thumb.height) // 2))
+            label = f"#{v['index'] + 1} · seed {v['seed']} · {v['model']}"
+        else:
+            draw.rectangle((x + 4, y + 4, x + GRID_CELL - 5, y + GRID_CELL - 5), fill=(60, 60, 66))
+            label = f"#{v['index'] + 1} · falló"
+        draw.text((x + 8, y + GRID_CELL + 6), label, font=font, fill=(230, 230, 230))
+
+    data, ext = encode_output(grid, fmt)
+    return data, ext, grid.width, grid.height
+
+
+def generate_variants(args, plan: list, width: int, height: int) -> tuple[dict, list]:
+    """
+    Lanza todas las variantes a la vez (pool acotado). Cada una sale ya con
+    watermark del hilo que la bajó; las que fallan o no llegan a tiempo se
+    reportan con ok=False y el resto se devuelve igual.
+    Devuelve (resultado, blobs) listo para write_output.
+    """
+    t0 = time.time()
+    variants = [{"index": i, "ok": False, "model": m, "seed": sd} for i, (m, sd) in enumerate(plan)]
+    items = {}
+
+    pool = ThreadPoolExecutor(max_workers=max(1, min(VARIANT_WORKERS, len(plan))))
+    futures = {pool.submit(generate_cached, args, m, sd, width, height): i for i, (m, sd) in enumerate(plan)}
+    try:
+        for fut in as_completed(futures, timeout=VARIANT_TIMEOUT):
+            i = futures[fut]
+            try:
+                res, data = fut.result()
+            except Exception as e:
+                res, data = {"ok": False, "error": str(e)}, None
+            res.pop("mode", None)
+            variants[i].update(res)
+            if data is not None:
+                items[i] = data
+    except FuturesTimeout:
+        for fut, i in futures.items():
+            if not fut.done():
+                variants[i]["error"] = f"timeout ({VARIANT_TIMEOUT:.0f}s)"
+    pool.shutdown(wait=False, cancel_futures=True)
+
+    ok_count = len(items)
+    result = {
+        "ok": ok_count > 0,
+        "mode": args.mode,
+        "width": width,
+        "height": height,
+        "variants": variants,
+        "failed": len(variants) - ok_count,
+        "elapsed_ms": int((time.time() - t0) * 1000),
+    }
+    if not ok_count:
+        first = next((v.get("error") for v in variants if v.get("error")), "sin detalle")
+        result["error"] = f"Ninguna variante salió: {first}"
+        return result, []
 
+    blobs = []
+    try:
+        grid_data, grid_ext, gw, gh = compose_grid(variants, items, args.out_format)
+        result["grid"] = {"ext": grid_ext, "width": gw, "height": gh}
+        blobs.append((result["grid"], grid_data))
     except Exception as e:
-        return jprint({"ok": False, "error": str(e)})
+        result["grid_error"] = str(e)
+    blobs.extend((variants[i], items[i]) for i in sorted(items))
+    return result, blobs
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("mode", choices=["generate", "edit"])
+    ap.add_argument("--prompt", required=True)
+    ap.add_argument("--model", default=os.getenv("POLLINATIONS_MODEL_FLUX", "flux"))
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--width", type=int, default=1024)
+    ap.add_argument("--height", type=int, default=1024)
+    ap.add_argument("--quality", default="medium")
+    ap.add_argument("--safe", default="false")
+    ap.add_argument("--enhance", default="true")
+    ap.add_argument("--nologo", default="true")
+    ap.add_argument("--image", default="")  # base image url for edit
+    ap.add_argument("--watermark", default="CenizaGPT")
+    ap.add_argument("--out-format", choices=["png", "webp"], default=OUTPUT_FORMAT if OUTPUT_FORMAT in ("png", "webp") else "png")
+    ap.add_argument("--output", choices=OUTPUT_MODES, default="base64")
+    ap.add_argument("--variants", type=int, default=1)
+    ap.add_argument("--models", default="")  # "flux,zimage": una variante por modelo
+    ap.add_argument("--no-cache", action="store_true")
+    ap.add_argument("--cache-only", action="store_true")
+    args = ap.parse_args()
+
+    args.prompt = (args.prompt or "").strip()
+    model_id = (args.model or "").strip() or os.getenv("POLLINATIONS_MODEL_FLUX", "flux")
+    seed = args.seed if args.seed and args.seed > 0 else random.randint(1, 9999999)
+
+    if not args.prompt:
+        return write_output({"ok": False, "error": "Prompt vacío."}, [], args.output)
+
+    if args.mode == "edit":
+        if not args.image or not is_http(args.image):
+            return write_output({"ok": False, "error": "Para editar necesitas --image con URL válida."}, [], args.output)
+
+    # clamp sizes
+    width = max(256, min(2048, int(args.width or 1024)))
+    height = max(256, min(2048, int(args.height or 1024)))
+
+    if args.cache_only:
+        result, data = cached_only(args, model_id, seed, width, height)
+        return write_output(result, [(result, data)] if data is not None else [], args.output)
+
+    if args.variants > 1 or args.models:
+        result, blobs = generate_variants(args, variant_plan(args, model_id, seed), width, height)
+        write_output(result, blobs, args.output)
+        if any(not v["ok"] and "timeout" in (v.get("error") or "") for v in result["variants"]):
+            # No esperamos a los hilos colgados: la salida ya está escrita
+            sys.stdout.flush()
+            os._exit(0)
+        return 0
+
+    result, data = generate_cached(args, model_id, seed, width, height)
+    return write_output(result, [(result, data)] if data is not None else [], args.output)
 
 
 if __name__ == "__main__":
@@ -4,6 +4,14 @@ import json
 import argparse
 import subprocess
 import shutil
+import re
+import html
+import tempfile
+import hashlib
+import math
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
 from groq import Groq
 import yt_dlp
 
@@ -12,6 +20,27 @@ import yt_dlp
 # =========================
 API_KEY = os.environ.get("GROQ_VIDEO_API_KEY")
 
+# Troceo de audios largos (el límite de subida de Whisper es 25MB)
+WHISPER_MAX_MB = 24
+CHUNK_SECONDS = int(os.environ.get("VIDEO_CHUNK_SECONDS", "600"))
+CHUNK_OVERLAP = float(os.environ.get("VIDEO_CHUNK_OVERLAP", "2"))
+CHUNK_WORKERS = int(os.environ.get("VIDEO_CHUNK_WORKERS", "4"))
+
+# Duración máxima que aceptamos procesar de una vez (en minutos)
+MAX_MINUTES = float(os.environ.get("VIDEO_MAX_MINUTES", "180"))
+
+# Map-reduce para transcripciones que no caben cómodas en un solo prompt
+MAP_REDUCE_TOKENS = int(os.environ.get("VIDEO_MAP_REDUCE_TOKENS", "12000"))
+MAP_CHUNK_TOKENS = int(os.environ.get("VIDEO_MAP_CHUNK_TOKENS", "6000"))
+MAP_WORKERS = int(os.environ.get("VIDEO_MAP_WORKERS", "4"))
+
+# Índice de segmentos con timestamps (reutilizable entre preguntas)
+INDEX_DIR = os.environ.get("VIDEO_INDEX_DIR", os.path.join(tempfile.gettempdir(), "ceniza_video_index"))
+INDEX_TTL = int(os.environ.get("VIDEO_INDEX_TTL", str(7 * 24 * 3600)))
+INDEX_MAX_MB = float(os.environ.get("VIDEO_INDEX_MAX_MB", "200"))
+WINDOW_SECONDS = int(os.environ.get("VIDEO_WINDOW_SECONDS", "60"))
+QA_TOKENS = int(os.environ.get("VIDEO_QA_TOKENS", "3000"))
+
 def get_client():
     if not API_KEY:
         raise ValueError("Falta GROQ_VIDEO_API_KEY en variables de entorno.")
@@ -43,25 +72,189 @@ def compress_for_whisper(input_audio, output_audio):
     subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
     return output_audio
 
-def download_audio_from_url(url, output_base="temp_audio", cookies_path=None, proxy_url=None):
-    output_template = f"{output_base}.%(ext)s"
-    final_output = f"{output_base}.mp3"
+def probe_duration(input_audio):
+    cmd = [
+        "ffprobe", "-v", "error",
+        "-show_entries", "format=duration",
+        "-of", "default=noprint_wrappers=1:nokey=1",
+        input_audio
+    ]
+    out = subprocess.run(cmd, capture_output=True, text=True, check=True).stdout.strip()
+    try:
+        return float(out)
+    except ValueError:
+        return 0.0
 
-    if os.path.exists(final_output):
-        os.remove(final_output)
+def detect_silence_intervals(input_audio, noise="-35dB", min_silence=0.5):
+    # Devuelve los tramos de silencio [(inicio, fin)] en segundos
+    cmd = [
+        "ffmpeg", "-hide_banner", "-nostats",
+        "-i", input_audio,
+        "-af", f"silencedetect=noise={noise}:d={min_silence}",
+        "-f", "null", "-"
+    ]
+    proc = subprocess.run(cmd, capture_output=True, text=True)
+    intervals = []
+    start = None
+    for line in proc.stderr.splitlines():
+        m = re.search(r"silence_start: (-?[\d.]+)", line)
+        if m:
+            start = max(0.0, float(m.group(1)))
+            continue
+        m = re.search(r"silence_end: ([\d.]+)", line)
+        if m and start is not None:
+            intervals.append((start, float(m.group(1))))
+            start = None
+    if start is not None:
+        # Silencio hasta el final del archivo
+        intervals.append((start, float("inf")))
+    return intervals
 
+def detect_silences(input_audio, noise="-35dB", min_silence=0.5):
+    # Devuelve el punto medio de cada tramo de silencio (en segundos)
+    return [(a + b) / 2 for a, b in detect_silence_intervals(input_audio, noise, min_silence) if b != float("inf")]
+
+def plan_chunks(duration, silences, target=CHUNK_SECONDS):
+    """
+    Elige puntos de corte cerca de cada múltiplo de `target`, usando el
+    silencio más cercano dentro de una ventana de +-20%. Si no hay silencio
+    cerca se corta en seco (el solape cubre la palabra partida).
+    Devuelve [(inicio, fin)] sin solape; el solape se añade al extraer.
+    """
+    window = target * 0.2
+    cuts = [0.0]
+    while duration - cuts[-1] > target + window:
+        ideal = cuts[-1] + target
+        near = [p for p in silences if abs(p - ideal) <= window]
+        cuts.append(min(near, key=lambda p: abs(p - ideal)) if near else ideal)
+    cuts.append(duration)
+    return list(zip(cuts[:-1], cuts[1:]))
+
+def extract_chunk(input_audio, start, end, output_audio):
+    cmd = ["ffmpeg", "-y", "-ss", f"{start:.3f}"]
+    if end != float("inf"):
+        cmd += ["-t", f"{end - start:.3f}"]
+    cmd += [
+        "-i", input_audio,
+        "-ac", "1",
+        "-ar", "16000",
+        "-b:a", "64k",
+        output_audio
+    ]
+    subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+    return output_audio
+
+# =========================
+# PREPROCESADO (silencios / velocidad)
+# =========================
+
+SPEED_MIN = 1.0
+SPEED_MAX = 2.0
+# Tope de tramos para aselect: ffmpeg evalúa todos los between() en cada
+# frame, así que con miles de pausas rellenamos los huecos más cortos
+MAX_KEEP_INTERVALS = int(os.environ.get("VIDEO_MAX_KEEP_INTERVALS", "200"))
+
+def keep_intervals(duration, silences, pad=0.25):
+    """
+    Complemento de los silencios: tramos con audio útil, con un pequeño
+    margen a cada lado para no cortar el principio/final de las palabras.
+    """
+    keep = []
+    cursor = 0.0
+    for a, b in silences:
+        a = max(cursor, a + pad if a > 0 else a)
+        b = min(duration, b - pad)
+        if b <= a:
+            continue
+        if a > cursor:
+            keep.append((cursor, a))
+        cursor = b
+    if duration > cursor:
+        keep.append((cursor, duration))
+    return keep
+
+def merge_intervals(keep, cap=MAX_KEEP_INTERVALS):
+    """Deja como mucho `cap` tramos uniendo los separados por los silencios más cortos."""
+    if cap <= 0 or len(keep) <= cap:
+        return keep
+    gaps = sorted((keep[i + 1][0] - keep[i][1], i) for i in range(len(keep) - 1))
+    fill = {i for _, i in gaps[:len(keep) - cap]}
+    merged = [keep[0]]
+    for i in range(1, len(keep)):
+        if i - 1 in fill:
+            merged[-1] = (merged[-1][0], keep[i][1])
+        else:
+            merged.append(keep[i])
+    return merged
+
+def build_time_map(keep, speed=1.0):
+    # pieces: (inicio en el audio procesado sin acelerar, inicio original, largo)
+    pieces = []
+    cum = 0.0
+    for a, b in keep:
+        pieces.append((cum, a, b - a))
+        cum += b - a
+    return {"pieces": pieces, "speed": speed}
+
+def map_time(time_map, t):
+    """Convierte un tiempo del audio procesado al tiempo del medio original."""
+    t = t * time_map["speed"]
+    pieces = time_map["pieces"]
+    if not pieces:
+        return t
+    for cum, src, length in pieces:
+        if t < cum + length:
+            return src + max(0.0, t - cum)
+    cum, src, length = pieces[-1]
+    return src + length
+
+def remap_segments(segments, time_map):
+    return [{**s, "start": map_time(time_map, s["start"]), "end": map_time(time_map, s["end"])} for s in segments]
+
+def preprocess_for_whisper(input_audio, output_audio, strip_silence=True, speed=1.0, min_silence=1.0):
+    """
+    Variante de compress_for_whisper que además quita silencios largos
+    (silencedetect + aselect, para poder reconstruir los tiempos) y acelera
+    con atempo. Devuelve el mapa de tiempos para remap_segments.
+    """
+    speed = max(SPEED_MIN, min(SPEED_MAX, float(speed or 1.0)))
+    duration = probe_duration(input_audio)
+
+    keep = [(0.0, duration)]
+    if strip_silence and duration > 0:
+        keep = keep_intervals(duration, detect_silence_intervals(input_audio, min_silence=min_silence)) or keep
+        keep = merge_intervals(keep)
+
+    filters = []
+    if keep != [(0.0, duration)]:
+        expr = "+".join(f"between(t,{a:.3f},{b:.3f})" for a, b in keep)
+        filters.append(f"aselect='{expr}'")
+        filters.append("asetpts=N/SR/TB")
+    if speed != 1.0:
+        filters.append(f"atempo={speed:.3f}")
+
+    cmd = ["ffmpeg", "-y", "-i", input_audio]
+    script_path = None
+    if filters:
+        # El filtro va en un archivo: como argumento puede pasar del límite de 128 KiB
+        script_path = output_audio + ".filter"
+        with open(script_path, "w", encoding="utf-8") as f:
+            f.write(",".join(filters))
+        cmd += ["-filter_script:a", script_path]
+    cmd += ["-ac", "1", "-ar", "16000", "-b:a", "64k", output_audio]
+    try:
+        subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+    finally:
+        if script_path and os.path.exists(script_path):
+            os.remove(script_path)
+    return build_time_map(keep, speed)
+
+def build_ydl_opts(cookies_path=None, proxy_url=None):
     ydl_opts = {
-        "format": "bestaudio/best[height<=480]",
-        "outtmpl": output_template,
         "quiet": True,
         "no_warnings": True,
         "noprogress": True,
         "logger": QuietLogger(),
-        "postprocessors": [{
-            "key": "FFmpegExtractAudio",
-            "preferredcodec": "mp3",
-            "preferredquality": "128",
-        }],
         "socket_timeout": 30,
         # Headers para simular navegador real y evitar bloqueos simples
         "http_headers": {
@@ -71,67 +264,651 @@ def download_audio_from_url(url, output_base="temp_audio", cookies_path=None, pr
             "Sec-Fetch-Mode": "navigate",
         }
     }
-    
+
     # Configuración de Cookies
     if cookies_path and os.path.exists(cookies_path):
         ydl_opts["cookiefile"] = cookies_path
-    
+
     # Configuración de Proxy (WARP / Tor / SOCKS5)
     if proxy_url:
         ydl_opts["proxy"] = proxy_url
         # Forzar IPv4 suele ser más estable en algunos proxies
         ydl_opts["source_address"] = "0.0.0.0"
 
+    return ydl_opts
+
+def download_audio_from_url(url, output_base="temp_audio", cookies_path=None, proxy_url=None, time_range=None):
+    output_template = f"{output_base}.%(ext)s"
+    final_output = f"{output_base}.mp3"
+
+    if os.path.exists(final_output):
+        os.remove(final_output)
+
+    ydl_opts = build_ydl_opts(cookies_path, proxy_url)
+    ydl_opts.update({
+        "format": "bestaudio/best[height<=480]",
+        "outtmpl": output_template,
+        "postprocessors": [{
+            "key": "FFmpegExtractAudio",
+            "preferredcodec": "mp3",
+            "preferredquality": "128",
+        }],
+    })
+
+    # Descarga parcial: sólo el tramo pedido (inicio, fin) en segundos
+    if time_range:
+        ydl_opts["download_ranges"] = yt_dlp.utils.download_range_func(None, [time_range])
+
     with yt_dlp.YoutubeDL(ydl_opts) as ydl:
         ydl.download([url])
     
     return final_output
 
+# =========================
+# SUBTÍTULOS
+# =========================
+
+# Orden de preferencia de formatos de subtítulo que sabemos parsear
+CAPTION_EXTS = ["vtt", "srv3", "srv1", "srv2"]
+
+def _lang_matches(code, lang):
+    code = (code or "").lower()
+    lang = (lang or "").lower()
+    return code == lang or code.startswith(lang + "-") or code.startswith(lang + "_")
+
+def pick_caption_track(info, lang="es"):
+    """
+    Elige la mejor pista de subtítulos del info dict de yt-dlp.
+    Prioridad: subtítulos del creador en el idioma pedido, auto-captions en el
+    idioma pedido, subtítulos en cualquier idioma, auto-captions originales.
+    Devuelve (track, lang_code, kind) o None.
+    """
+    manual = info.get("subtitles") or {}
+    auto = info.get("automatic_captions") or {}
+    original_lang = info.get("language") or ""
+
+    def best_format(tracks):
+        by_ext = {t.get("ext"): t for t in tracks if t.get("url")}
+        for ext in CAPTION_EXTS:
+            if ext in by_ext:
+                return by_ext[ext]
+        return None
+
+    candidates = []
+    for code in manual:
+        if _lang_matches(code, lang):
+            candidates.append((manual, code, "subtitles"))
+    # "xx-orig" es el reconocimiento original; el resto son traducciones automáticas
+    for code in sorted(auto, key=lambda c: not c.endswith("-orig")):
+        if _lang_matches(code, lang):
+            candidates.append((auto, code, "auto_captions"))
+    for code in manual:
+        if code != "live_chat":
+            candidates.append((manual, code, "subtitles"))
+    for code in auto:
+        if code.endswith("-orig") or (original_lang and _lang_matches(code, original_lang)):
+            candidates.append((auto, code, "auto_captions"))
+
+    for tracks, code, kind in candidates:
+        track = best_format(tracks.get(code) or [])
+        if track:
+            return track, code, kind
+    return None
+
+def _vtt_time(ts):
+    parts = ts.strip().replace(",", ".").split(":")
+    secs = 0.0
+    for p in parts:
+        secs = secs * 60 + float(p)
+    return secs
+
+def parse_vtt(text):
+    segments = []
+    blocks = re.split(r"\r?\n\r?\n", text)
+    for block in blocks:
+        lines = [l for l in block.splitlines() if l.strip()]
+        for i, line in enumerate(lines):
+            if "-->" not in line:
+                continue
+            start_s, end_s = line.split("-->", 1)
+            try:
+                start = _vtt_time(start_s)
+                end = _vtt_time(end_s.strip().split(" ")[0])
+            except ValueError:
+                break
+            body = " ".join(lines[i + 1:])
+            body = re.sub(r"<[^>]+>", "", body)
+            body = html.unescape(body).strip()
+            if body:
+                segments.append({"start": start, "end": end, "text": body})
+            break
+    return _dedupe_rolling(segments)
+
+def parse_srv(text):
+    root = ET.fromstring(text)
+    segments = []
+    # srv1/srv2: <text start="s" dur="s">; srv3: <p t="ms" d="ms">
+    for node in root.iter():
+        if node.tag == "text":
+            start = float(node.get("start", 0))
+            dur = float(node.get("dur", 0))
+        elif node.tag == "p":
+            start = float(node.get("t", 0)) / 1000.0
+            dur = float(node.get("d", 0)) / 1000.0
+        else:
+            continue
+        body = html.unescape("".join(node.itertext())).strip()
+        if body:
+            segments.append({"start": start, "end": start + dur, "text": body})
+    return _dedupe_rolling(segments)
+
+def _dedupe_rolling(segments):
+    # Las auto-captions de YouTube repiten la línea anterior en cada cue
+    out = []
+    for seg in segments:
+        text = " ".join(seg["text"].split())
+        if out:
+            prev = out[-1]["text"]
+            if text == prev:
+                out[-1]["end"] = max(out[-1]["end"], seg["end"])
+                continue
+            if text.startswith(prev):
+                text = text[len(prev):].strip()
+                if not text:
+                    continue
+        out.append({"start": seg["start"], "end": seg["end"], "text": text})
+    return out
+
+def parse_captions(text, ext):
+    if ext == "vtt":
+        return parse_vtt(text)
+    return parse_srv(text)
+
+def format_timestamp(seconds):
+    seconds = int(seconds)
+    h, rem = divmod(seconds, 3600)
+    m, s = divmod(rem, 60)
+    if h:
+        return f"{h}:{m:02d}:{s:02d}"
+    return f"{m:02d}:{s:02d}"
+
+def segments_to_text(segments):
+    return "\n".join(f"[{format_timestamp(s['start'])}] {s['text']}" for s in segments)
+
+def fetch_media_info(url, cookies_path=None, proxy_url=None):
+    # Sólo metadatos (duración, formatos, subtítulos); no baja nada
+    ydl_opts = build_ydl_opts(cookies_path, proxy_url)
+    ydl_opts["skip_download"] = True
+    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        info = ydl.extract_info(url, download=False)
+    return ydl.sanitize_info(info) if info else {}
+
+def fetch_captions(info, lang="es", cookies_path=None, proxy_url=None):
+    """
+    Intenta obtener subtítulos (del creador o automáticos) sin bajar audio.
+    Devuelve (segments, source) o (None, None) si no hay subtítulos utilizables.
+    """
+    picked = pick_caption_track(info or {}, lang)
+    if not picked:
+        return None, None
+    track, code, kind = picked
+
+    with yt_dlp.YoutubeDL(build_ydl_opts(cookies_path, proxy_url)) as ydl:
+        raw = ydl.urlopen(track["url"]).read().decode("utf-8", errors="replace")
+
+    segments = parse_captions(raw, track.get("ext"))
+    if not segments:
+        return None, None
+    return segments, f"{kind}:{code}"
+
+# =========================
+# PREFLIGHT / RANGOS
+# =========================
+
+def parse_time(value):
+    """Acepta segundos ("95"), "mm:ss" o "hh:mm:ss". None si viene vacío."""
+    if value is None or str(value).strip() == "":
+        return None
+    try:
+        return _vtt_time(str(value))
+    except ValueError:
+        raise ValueError(f"Tiempo inválido: {value} (usa segundos, mm:ss o hh:mm:ss)")
+
+def resolve_range(duration, start=None, end=None, max_minutes=None):
+    """
+    Calcula el tramo a procesar. Sin --end y con --max-minutes se toman los
+    primeros N minutos desde --start. El tope MAX_MINUTES no se aplica aquí:
+    con subtítulos no se descarga nada (ver limit_range).
+    Devuelve (inicio, fin) o None si hay que procesar todo el medio.
+    """
+    start = start or 0.0
+    if end is None and max_minutes:
+        end = start + max_minutes * 60
+    if duration and end is not None:
+        end = min(end, duration)
+    if end is not None and end <= start:
+        raise ValueError("El tiempo de fin debe ser mayor que el de inicio.")
+
+    if start <= 0 and (end is None or (duration and end >= duration)):
+        return None
+    return (start, end if end is not None else (duration or float("inf")))
+
+def limit_range(time_range, duration):
+    """
+    Tope MAX_MINUTES para cuando toca bajar/transcribir el audio: si el tramo
+    se pasa, nos quedamos con los primeros MAX_MINUTES desde su inicio.
+    Devuelve (tramo, aviso o None).
+    """
+    start, end = time_range if time_range else (0.0, duration or float("inf"))
+    if not MAX_MINUTES or end - start <= MAX_MINUTES * 60:
+        return time_range, None
+    end = start + MAX_MINUTES * 60
+    length = f"dura {format_timestamp(duration)}" if duration else "no indica su duración"
+    note = (
+        f"ℹ️ El video {length} y sin subtítulos sólo puedo transcribir "
+        f"{MAX_MINUTES:g} minutos: analicé de {format_timestamp(start)} a {format_timestamp(end)}. "
+        "Usa las opciones `inicio` y `fin` para elegir otro tramo."
+    )
+    return (start, end), note
+
+def clip_segments(segments, time_range):
+    if not time_range:
+        return segments
+    start, end = time_range
+    return [s for s in segments if s["end"] > start and s["start"] < end]
+
 # =========================
 # CORE LOGIC
 # =========================
 
-def transcribe_audio(client, audio_path):
-    compressed = "temp_compressed.mp3"
-    compress_for_whisper(audio_path, compressed)
-    
-    size_mb = os.path.getsize(compressed) / (1024 * 1024)
-    if size_mb > 24:
-        raise ValueError(f"El audio es muy largo ({size_mb:.1f}MB). Límite actual de 25MB.")
-    
-    with open(compressed, "rb") as f:
+def _seg_field(seg, name):
+    if isinstance(seg, dict):
+        return seg.get(name)
+    return getattr(seg, name, None)
+
+def whisper_segments(client, audio_path):
+    with open(audio_path, "rb") as f:
         transcription = client.audio.transcriptions.create(
-            file=(compressed, f.read()),
+            file=(os.path.basename(audio_path), f.read()),
             model="whisper-large-v3",
-            response_format="json",
+            response_format="verbose_json",
             temperature=0.0
         )
-    return transcription.text
+    raw = getattr(transcription, "segments", None) or []
+    segments = []
+    for seg in raw:
+        text = (_seg_field(seg, "text") or "").strip()
+        if text:
+            segments.append({
+                "start": float(_seg_field(seg, "start") or 0.0),
+                "end": float(_seg_field(seg, "end") or 0.0),
+                "text": text,
+            })
+    if not segments and transcription.text:
+        segments.append({"start": 0.0, "end": 0.0, "text": transcription.text.strip()})
+    return segments
 
-def analyze_transcript(client, transcript, prompt, model):
-    messages = [
-        {
-            "role": "system",
-            "content": (
-                "Eres CenizaGPT. Te pasaré la transcripción de un video o audio. "
-                "Tu tarea es responder al prompt del usuario basándote en esa transcripción. "
-                "Responde en el mismo idioma que el usuario."
-            )
-        },
-        {
-            "role": "user",
-            "content": f"TRANSCRIPCIÓN:\n{transcript}\n\nPROMPT DEL USUARIO:\n{prompt}"
-        }
-    ]
+def stitch_chunks(chunk_results):
+    """
+    chunk_results: [(inicio_propio, fin_propio, offset, segments)] en orden.
+    Cada segmento se desplaza por el offset de su trozo y sólo se conserva
+    si su punto medio cae en el tramo propio del trozo (descarta el solape).
+    """
+    out = []
+    for own_start, own_end, offset, segments in chunk_results:
+        for seg in segments:
+            start = seg["start"] + offset
+            end = seg["end"] + offset
+            mid = (start + end) / 2
+            if mid < own_start or mid >= own_end:
+                continue
+            if out and out[-1]["text"] == seg["text"]:
+                continue
+            out.append({"start": start, "end": end, "text": seg["text"]})
+    return out
+
+def transcribe_chunked(client, audio_path, duration):
+    chunks = plan_chunks(duration, detect_silences(audio_path))
+    workdir = tempfile.mkdtemp(prefix="ceniza_vid_")
+
+    def work(index, own_start, own_end):
+        start = max(0.0, own_start - CHUNK_OVERLAP)
+        end = min(duration, own_end + CHUNK_OVERLAP)
+        path = extract_chunk(audio_path, start, end, os.path.join(workdir, f"chunk_{index:03d}.mp3"))
+        size_mb = os.path.getsize(path) / (1024 * 1024)
+        if size_mb > WHISPER_MAX_MB:
+            raise ValueError(f"Un trozo de audio quedó muy grande ({size_mb:.1f}MB).")
+        # El último trozo se queda con todo lo que sobre al final
+        last = index == len(chunks) - 1
+        return own_start, float("inf") if last else own_end, start, whisper_segments(client, path)
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, CHUNK_WORKERS)) as pool:
+            futures = [pool.submit(work, i, a, b) for i, (a, b) in enumerate(chunks)]
+            results = [f.result() for f in futures]
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return stitch_chunks(results)
+
+def shift_segments(segments, offset):
+    if not offset:
+        return segments
+    return [{**s, "start": s["start"] + offset, "end": s["end"] + offset} for s in segments]
+
+def transcribe_segments(client, audio_path, compressed=False):
+    duration = probe_duration(audio_path)
+    if duration > CHUNK_SECONDS * 1.2:
+        return transcribe_chunked(client, audio_path, duration)
+
+    if not compressed:
+        compress_for_whisper(audio_path, "temp_compressed.mp3")
+        audio_path = "temp_compressed.mp3"
     
+    size_mb = os.path.getsize(audio_path) / (1024 * 1024)
+    if size_mb > WHISPER_MAX_MB:
+        # Duración desconocida o bitrate raro: trocear igual
+        duration = probe_duration(audio_path)
+        if duration <= 0:
+            raise ValueError(f"El audio es muy largo ({size_mb:.1f}MB). Límite actual de 25MB.")
+        return transcribe_chunked(client, audio_path, duration)
+    
+    return whisper_segments(client, audio_path)
+
+def transcribe_audio(client, audio_path, offset=0.0, strip_silence=False, speed=1.0):
+    # offset: segundo del medio original en el que empieza este audio
+    time_map = None
+    workdir = None
+    try:
+        if strip_silence or speed != 1.0:
+            workdir = tempfile.mkdtemp(prefix="ceniza_vid_")
+            preprocessed = os.path.join(workdir, "preprocessed.mp3")
+            time_map = preprocess_for_whisper(audio_path, preprocessed, strip_silence, speed)
+            audio_path = preprocessed
+
+        segments = transcribe_segments(client, audio_path, compressed=time_map is not None)
+    finally:
+        if workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+    if time_map:
+        segments = remap_segments(segments, time_map)
+    return shift_segments(segments, offset)
+
+def estimate_tokens(text):
+    # Aproximación barata (~4 caracteres por token) para decidir el troceo
+    return len(text) // 4 + 1
+
+def split_transcript(transcript, max_tokens=MAP_CHUNK_TOKENS):
+    # Corta por líneas para no partir frases ni separar el timestamp de su texto
+    chunks = []
+    current = []
+    size = 0
+    for line in transcript.splitlines():
+        cost = estimate_tokens(line)
+        if current and size + cost > max_tokens:
+            chunks.append("\n".join(current))
+            current = []
+            size = 0
+        current.append(line)
+        size += cost
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+def chat_completion(client, model, system, user, max_tokens=1024, temperature=0.5):
     chat = client.chat.completions.create(
-        messages=messages,
+        messages=[
+            {"role": "system", "content": system},
+            {"role": "user", "content": user}
+        ],
         model=model,
-        temperature=0.5,
-        max_tokens=1024
+        temperature=temperature,
+        max_tokens=max_tokens
     )
     return chat.choices[0].message.content
 
+def analyze_transcript(client, transcript, prompt, model):
+    if estimate_tokens(transcript) > MAP_REDUCE_TOKENS:
+        return analyze_map_reduce(client, transcript, prompt, model)
+
+    return chat_completion(
+        client,
+        model,
+        (
+            "Eres CenizaGPT. Te pasaré la transcripción de un video o audio. "
+            "Tu tarea es responder al prompt del usuario basándote en esa transcripción. "
+            "Responde en el mismo idioma que el usuario."
+        ),
+        f"TRANSCRIPCIÓN:\n{transcript}\n\nPROMPT DEL USUARIO:\n{prompt}"
+    )
+
+def analyze_map_reduce(client, transcript, prompt, model):
+    """
+    Transcripciones largas: cada trozo se resume/extrae en paralelo (map) y
+    una última llamada responde al usuario a partir de esas notas (reduce).
+    """
+    chunks = split_transcript(transcript)
+    map_system = (
+        "Eres CenizaGPT. Te pasaré UN FRAGMENTO de la transcripción de un video o audio "
+        "y la pregunta del usuario. Extrae en notas breves todo lo del fragmento que sirva "
+        "para responder (hechos, nombres, cifras, citas cortas), conservando los timestamps [mm:ss]. "
+        "Si el fragmento no aporta nada, añade un resumen de una o dos líneas. No respondas todavía la pregunta."
+    )
+
+    def work(index, chunk):
+        user = (
+            f"FRAGMENTO {index + 1}/{len(chunks)}:\n{chunk}\n\n"
+            f"PREGUNTA DEL USUARIO:\n{prompt}"
+        )
+        return chat_completion(client, model, map_system, user, max_tokens=512, temperature=0.2)
+
+    with ThreadPoolExecutor(max_workers=max(1, MAP_WORKERS)) as pool:
+        notes = list(pool.map(work, range(len(chunks)), chunks))
+
+    joined = "\n\n".join(f"NOTAS DEL FRAGMENTO {i + 1}:\n{n}" for i, n in enumerate(notes))
+    return chat_completion(
+        client,
+        model,
+        (
+            "Eres CenizaGPT. Te pasaré notas extraídas, en orden, de los fragmentos de la "
+            "transcripción de un video o audio largo. Responde al prompt del usuario basándote "
+            "sólo en esas notas y cita los timestamps cuando ayuden. "
+            "Responde en el mismo idioma que el usuario."
+        ),
+        f"NOTAS:\n{joined}\n\nPROMPT DEL USUARIO:\n{prompt}"
+    )
+
+# =========================
+# ÍNDICE DE SEGMENTOS (ventanas + BM25)
+# =========================
+
+STOPWORDS = set("""
+a al algo como con de del el en es esa ese eso esta este esto ha hay la las le lo los me mi no o para pero por que qué se si sí su sus te tu un una uno y ya
+video vídeo dice dicen habla hablan pasa momento parte
+the a an and are at be do does for from in is it of on or that the this to what when where who why with
+""".split())
+
+# "minuto 12", "min 12", "12:30", "1:02:03"
+TIME_PATTERNS = [
+    re.compile(r"\b(\d{1,2}:\d{2}(?::\d{2})?)\b"),
+    re.compile(r"\bmin(?:uto|utos|ute|utes)?\.?\s*(\d{1,3})\b", re.IGNORECASE),
+]
+
+# Preguntas que necesitan todo el contenido y no unas pocas ventanas
+GLOBAL_HINTS = re.compile(
+    r"resum|de qu[eé] (trata|va|habla)|todo el video|en general|summar|overview|what is .* about",
+    re.IGNORECASE
+)
+
+def tokenize(text):
+    return [t for t in re.findall(r"\w+", text.lower()) if t not in STOPWORDS and len(t) > 1]
+
+def build_windows(segments, window_seconds=WINDOW_SECONDS):
+    windows = []
+    for seg in segments:
+        if not windows or seg["start"] - windows[-1]["start"] >= window_seconds:
+            windows.append({"start": seg["start"], "end": seg["end"], "lines": []})
+        win = windows[-1]
+        win["end"] = max(win["end"], seg["end"])
+        win["lines"].append(f"[{format_timestamp(seg['start'])}] {seg['text']}")
+    for win in windows:
+        win["text"] = "\n".join(win.pop("lines"))
+    return windows
+
+def bm25_scores(windows, query, k1=1.5, b=0.75):
+    terms = set(tokenize(query))
+    if not terms or not windows:
+        return [0.0] * len(windows)
+    docs = [tokenize(w["text"]) for w in windows]
+    avg_len = sum(len(d) for d in docs) / len(docs) or 1.0
+    df = {t: sum(1 for d in docs if t in d) for t in terms}
+    n = len(docs)
+    scores = []
+    for doc in docs:
+        score = 0.0
+        for t in terms:
+            tf = doc.count(t)
+            if not tf:
+                continue
+            idf = math.log(1 + (n - df[t] + 0.5) / (df[t] + 0.5))
+            score += idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * len(doc) / avg_len))
+        scores.append(score)
+    return scores
+
+def time_references(prompt):
+    refs = []
+    for m in TIME_PATTERNS[0].finditer(prompt):
+        refs.append(_vtt_time(m.group(1)))
+    for m in TIME_PATTERNS[1].finditer(prompt):
+        refs.append(int(m.group(1)) * 60.0)
+    return refs
+
+def select_windows(windows, prompt, max_tokens=QA_TOKENS):
+    """
+    Elige las ventanas relevantes para la pregunta: primero las cercanas a
+    los tiempos que mencione, después las mejor puntuadas por BM25, hasta
+    llenar el presupuesto. Devuelve None si la pregunta necesita todo el
+    contenido (resúmenes) o si no hay ninguna coincidencia.
+    """
+    if GLOBAL_HINTS.search(prompt):
+        return None
+
+    picked = []
+    for t in time_references(prompt):
+        for i, w in enumerate(windows):
+            if w["start"] - WINDOW_SECONDS <= t <= w["end"] + WINDOW_SECONDS and i not in picked:
+                picked.append(i)
+
+    scores = bm25_scores(windows, prompt)
+    ranked = sorted((i for i, sc in enumerate(scores) if sc > 0), key=lambda i: -scores[i])
+    if not picked and not ranked:
+        return None
+
+    chosen = []
+    budget = 0
+    for i in picked + [i for i in ranked if i not in picked]:
+        cost = estimate_tokens(windows[i]["text"])
+        if chosen and budget + cost > max_tokens:
+            break
+        chosen.append(i)
+        budget += cost
+    return [windows[i] for i in sorted(chosen)]
+
+def answer_from_windows(client, windows, prompt, model):
+    excerpts = "\n\n".join(
+        f"[{format_timestamp(w['start'])} - {format_timestamp(w['end'])}]\n{w['text']}" for w in windows
+    )
+    return chat_completion(
+        client,
+        model,
+        (
+            "Eres CenizaGPT. Te pasaré sólo los fragmentos relevantes (con timestamps) de la "
+            "transcripción de un video o audio. Responde al prompt del usuario basándote en esos "
+            "fragmentos y cita los timestamps [mm:ss] de donde sale cada dato. "
+            "Si los fragmentos no alcanzan para responder, dilo. "
+            "Responde en el mismo idioma que el usuario."
+        ),
+        f"FRAGMENTOS:\n{excerpts}\n\nPROMPT DEL USUARIO:\n{prompt}"
+    )
+
+def answer_question(client, segments, prompt, model):
+    """Devuelve (respuesta, ventanas usadas o None si se usó la transcripción entera)."""
+    transcript = segments_to_text(segments)
+    if estimate_tokens(transcript) > QA_TOKENS:
+        windows = select_windows(build_windows(segments), prompt)
+        if windows:
+            return answer_from_windows(client, windows, prompt, model), windows
+    return analyze_transcript(client, transcript, prompt, model), None
+
+def index_key(args):
+    if args.mode == "url":
+        ident = args.input.strip()
+    else:
+        h = hashlib.sha1()
+        with open(args.input, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                h.update(block)
+        ident = h.hexdigest()
+    parts = [args.mode, ident, args.lang, str(args.force_whisper), str(args.start), str(args.end), str(args.max_minutes)]
+    return hashlib.sha1("|".join(parts).encode("utf-8")).hexdigest()
+
+def load_index(key):
+    path = os.path.join(INDEX_DIR, f"{key}.json")
+    try:
+        if time.time() - os.path.getmtime(path) > INDEX_TTL:
+            os.remove(path)
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def cleanup_index(max_age=INDEX_TTL, max_bytes=None):
+    """
+    Borra índices caducados (y .tmp huérfanos) y, si el directorio sigue
+    pasando de VIDEO_INDEX_MAX_MB, los más viejos hasta quedar por debajo.
+    """
+    if max_bytes is None:
+        max_bytes = INDEX_MAX_MB * 1024 * 1024
+    try:
+        entries = list(os.scandir(INDEX_DIR))
+    except OSError:
+        return
+    limit = time.time() - max_age
+    alive = []
+    for entry in entries:
+        try:
+            if not entry.is_file():
+                continue
+            st = entry.stat()
+            if st.st_mtime < limit:
+                os.remove(entry.path)
+            elif entry.name.endswith(".json"):
+                alive.append((st.st_mtime, st.st_size, entry.path))
+        except OSError:
+            pass
+
+    total = sum(size for _, size, _ in alive)
+    for _, size, path in sorted(alive):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            pass
+
+def save_index(key, data):
+    try:
+        os.makedirs(INDEX_DIR, exist_ok=True)
+        cleanup_index()
+        tmp = os.path.join(INDEX_DIR, f"{key}.json.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp, os.path.join(INDEX_DIR, f"{key}.json"))
+    except OSError:
+        pass
+
 # =========================
 # ENTRY POINT
 # =========================
@@ -145,59 +922,154 @@ def main():
     parser.add_argument("--cookies", help="Path al archivo de cookies")
     # Nuevo argumento simplificado para proxy fijo
     parser.add_argument("--proxy", help="URL del proxy (ej: socks5://127.0.0.1:40000)")
+    parser.add_argument("--lang", default="es", help="Idioma preferido para subtítulos")
+    parser.add_argument("--force-whisper", action="store_true", help="Ignorar subtítulos y transcribir el audio")
+    parser.add_argument("--start", help="Inicio del tramo a analizar (segundos, mm:ss o hh:mm:ss)")
+    parser.add_argument("--end", help="Fin del tramo a analizar (segundos, mm:ss o hh:mm:ss)")
+    parser.add_argument("--max-minutes", type=float, help="Analizar sólo los primeros N minutos desde --start")
+    parser.add_argument("--strip-silence", action="store_true", help="Quitar silencios largos antes de transcribir")
+    parser.add_argument("--speed", type=float, default=1.0, help=f"Acelerar el audio antes de transcribir ({SPEED_MIN}-{SPEED_MAX})")
     
     args = parser.parse_args()
     
     result = {"ok": False, "answer": ""}
     
     try:
-        require_ffmpeg()
         client = get_client()
         
         audio_path = None
+        range_path = None
+        workdir = None
+        segments = None
+        source = "whisper"
+        start = parse_time(args.start)
+        end = parse_time(args.end)
+
+        # 0. ¿Ya transcribimos este medio? (preguntas siguientes sobre el mismo video)
+        if args.mode == "file" and not os.path.exists(args.input):
+            raise FileNotFoundError(f"No se encontró el archivo: {args.input}")
+        key = index_key(args)
+        cached = load_index(key)
+        if cached:
+            segments = cached["segments"]
+            source = cached["source"]
+            result["duration"] = cached.get("duration")
+            if cached.get("range"):
+                result["range"] = cached["range"]
+            if cached.get("note"):
+                result["note"] = cached["note"]
+            result["cached_index"] = True
         
-        # 1. Obtener audio
-        if args.mode == "url":
-            # Intentamos descarga directa con el proxy proporcionado
+        # 1. Preflight: sólo metadatos, antes de bajar nada
+        info = {}
+        if segments is None and args.mode == "url":
             try:
-                audio_path = download_audio_from_url(
-                    args.input, 
-                    "temp_dl_audio", 
-                    args.cookies, 
-                    args.proxy
-                )
+                info = fetch_media_info(args.input, args.cookies, args.proxy)
             except Exception as e:
-                # Mejora en el mensaje de error para debugging
                 raise RuntimeError(f"Fallo en descarga (Proxy: {args.proxy or 'Ninguno'}): {str(e)}")
-                
-        else:
-            audio_path = args.input
-            if not os.path.exists(audio_path):
-                raise FileNotFoundError(f"No se encontró el archivo: {audio_path}")
+            if info.get("is_live"):
+                raise ValueError("Es una transmisión en vivo; espera a que termine para analizarla.")
+            duration = info.get("duration") or 0
+        elif segments is None:
+            require_ffmpeg()
+            duration = probe_duration(args.input)
+
+        if segments is None:
+            time_range = resolve_range(duration, start, end, args.max_minutes)
+            result["duration"] = duration
+            if time_range:
+                result["range"] = [time_range[0], time_range[1] if time_range[1] != float("inf") else None]
         
-        if not audio_path:
-            raise RuntimeError("No se pudo obtener el audio.")
+        # 2. Subtítulos primero (sin descarga, ffmpeg ni Whisper)
+        if segments is None and args.mode == "url" and not args.force_whisper:
+            try:
+                segments, caption_source = fetch_captions(
+                    info,
+                    args.lang,
+                    args.cookies,
+                    args.proxy
+                )
+                segments = clip_segments(segments or [], time_range) or None
+                if segments:
+                    source = caption_source
+            except Exception:
+                # Si falla la descarga de subtítulos seguimos con el audio
+                segments = None
 
-        # 2. Transcribir
-        transcript = transcribe_audio(client, audio_path)
+        if segments is None:
+            require_ffmpeg()
+
+            # Sin subtítulos: el tope de minutos sí aplica (primeros N minutos del tramo)
+            time_range, note = limit_range(time_range, duration)
+            if note:
+                result["note"] = note
+                result["range"] = [time_range[0], time_range[1]]
+
+            # 3. Obtener audio (sólo el tramo pedido)
+            if args.mode == "url":
+                # Intentamos descarga directa con el proxy proporcionado
+                try:
+                    audio_path = download_audio_from_url(
+                        args.input, 
+                        "temp_dl_audio", 
+                        args.cookies, 
+                        args.proxy,
+                        time_range
+                    )
+                except Exception as e:
+                    # Mejora en el mensaje de error para debugging
+                    raise RuntimeError(f"Fallo en descarga (Proxy: {args.proxy or 'Ninguno'}): {str(e)}")
+                    
+            elif time_range:
+                workdir = tempfile.mkdtemp(prefix="ceniza_vid_")
+                range_path = extract_chunk(args.input, time_range[0], time_range[1], os.path.join(workdir, "range.mp3"))
+                audio_path = range_path
+            else:
+                audio_path = args.input
+            
+            if not audio_path:
+                raise RuntimeError("No se pudo obtener el audio.")
+
+            # 4. Transcribir (timestamps relativos al medio original)
+            offset = time_range[0] if time_range else 0.0
+            segments = transcribe_audio(client, audio_path, offset, args.strip_silence, args.speed)
+
+        if not cached and segments:
+            save_index(key, {
+                "source": source,
+                "duration": result.get("duration"),
+                "range": result.get("range"),
+                "note": result.get("note"),
+                "segments": segments,
+            })
         
-        # 3. Analizar con LLM
-        answer = analyze_transcript(client, transcript, args.prompt, args.model)
+        # 5. Analizar con LLM (sólo las ventanas relevantes si la transcripción es larga)
+        transcript = segments_to_text(segments or [])
+        if not transcript:
+            raise RuntimeError("La transcripción quedó vacía.")
+        answer, windows = answer_question(client, segments, args.prompt, args.model)
+        if windows:
+            result["windows"] = [[w["start"], w["end"]] for w in windows]
         
         result["ok"] = True
         result["answer"] = answer
+        result["source"] = source
         result["transcript_preview"] = transcript[:200]
         
         # Cleanup
-        if args.mode == "url" and os.path.exists(audio_path):
+        if args.mode == "url" and audio_path and os.path.exists(audio_path):
              try: os.remove(audio_path)
              except: pass
-        if os.path.exists("temp_compressed.mp3"):
-             try: os.remove("temp_compressed.mp3")
-             except: pass
+        for temp in ("temp_compressed.mp3",):
+            if os.path.exists(temp):
+                 try: os.remove(temp)
+                 except: pass
 
     except Exception as e:
         result["error"] = str(e)
+    finally:
+        if workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
 
     print(json.dumps(result))
 
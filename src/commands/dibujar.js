@@ -1,12 +1,14 @@
 // src/commands/dibujar.js
 const { SlashCommandBuilder, AttachmentBuilder } = require('discord.js');
-const { generateImage } = require('../pollinations/pollinationsBridge');
+const { findCachedImage, generateImage, generateVariants } = require('../pollinations/pollinationsBridge');
 const {
   canUseNanobananaGen,
   consumeNanobananaGen,
+  refundNanobananaGen,
   remainingNanobananaGen,
   canUseNanobananaGlobal,
   consumeNanobananaGlobal,
+  refundNanobananaGlobal,
   remainingNanobananaGlobal,
 } = require('../pollinations/usageLimits');
 
@@ -42,7 +44,14 @@ module.exports = {
         .setRequired(false)
     )
     .addIntegerOption((o) => o.setName('seed').setDescription('Seed (opcional)').setRequired(false))
-    .addIntegerOption((o) => o.setName('size').setDescription('Tamaño 512 o 1024').setRequired(false)),
+    .addIntegerOption((o) => o.setName('size').setDescription('Tamaño 512 o 1024').setRequired(false))
+    .addIntegerOption((o) =>
+      o.setName('variantes')
+        .setDescription('Varias versiones a la vez (2-4, no aplica a Nanoceniza Pro)')
+        .setMinValue(2)
+        .setMaxValue(4)
+        .setRequired(false)
+    ),
 
   async execute(interaction) {
     await interaction.deferReply();
@@ -53,9 +62,18 @@ module.exports = {
     const size = interaction.options.getInteger('size') || 1024;
 
     const { id: modelId, label, kind } = mapUserModelToId(modeloChoice);
+    // Nanoceniza Pro tiene cupo de 1/día: nada de variantes
+    const variantes = kind === 'nano' ? 1 : (interaction.options.getInteger('variantes') || 1);
+
+    const width = size === 512 ? 512 : 1024;
+    const height = width;
+
+    // Con seed fija puede estar en caché: un acierto no gasta cupo, así que
+    // se mira antes de comprobar los límites
+    const cachedOut = kind === 'nano' ? await findCachedImage('generate', { prompt, modelId, seed, width, height }) : null;
 
     // Nanoceniza Pro: aplicar límites (1/día usuario + global 15/día)
-    if (kind === 'nano') {
+    if (kind === 'nano' && !cachedOut) {
       const uid = interaction.user.id;
 
       const okUser = canUseNanobananaGen(uid);
@@ -76,17 +94,39 @@ module.exports = {
       consumeNanobananaGlobal();
     }
 
-    const width = size === 512 ? 512 : 1024;
-    const height = width;
-
     try {
-      const out = await generateImage({ prompt, modelId, seed, width, height });
+      if (variantes > 1) {
+        const out = await generateVariants({ prompt, modelId, seed, width, height, variants: variantes });
+        const ok = out.variants.filter((v) => v.ok);
+
+        const files = [];
+        if (out.grid) files.push(new AttachmentBuilder(out.grid.buffer, { name: `ceniza_grid.${out.grid.ext}` }));
+        for (const v of ok) {
+          files.push(new AttachmentBuilder(v.buffer, { name: `ceniza_${v.index + 1}.${v.ext}` }));
+        }
+
+        const seeds = ok.map((v) => `#${v.index + 1}: ${v.seed}`).join(' · ');
+        const failed = out.failed ? ` | ⚠️ ${out.failed} fallaron` : '';
+        await interaction.editReply({
+          content: `🖼️ **Modelo:** ${label} | **Variantes:** ${ok.length}/${out.variants.length}${failed}\n**Seeds:** ${seeds}\n**Prompt:** ${String(prompt).slice(0, 800)}`.slice(0, 1900),
+          files,
+        });
+        return;
+      }
+
+      const out = cachedOut || await generateImage({ prompt, modelId, seed, width, height });
 
       if (!out || !out.ok || !out.buffer) {
         throw new Error('generateImage devolvió resultado inválido');
       }
 
-      const attachment = new AttachmentBuilder(out.buffer, { name: 'ceniza.png' });
+      // Otra petición igual llenó la caché mientras tanto: devolvemos el cupo
+      if (kind === 'nano' && !cachedOut && out.cached) {
+        refundNanobananaGen(interaction.user.id);
+        refundNanobananaGlobal();
+      }
+
+      const attachment = new AttachmentBuilder(out.buffer, { name: `ceniza.${out.ext || 'png'}` });
 
       await interaction.editReply({
         content: `🖼️ **Modelo:** ${label} | **Seed:** ${out.seed ?? seed}\n**Prompt:** ${String(prompt).slice(0, 800)}`.slice(0, 1900),
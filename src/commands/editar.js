@@ -1,12 +1,14 @@
 // src/commands/editar.js
 const { SlashCommandBuilder, AttachmentBuilder } = require('discord.js');
-const { editImage } = require('../pollinations/pollinationsBridge');
+const { editImage, findCachedImage } = require('../pollinations/pollinationsBridge');
 const {
   canUseNanobanana,
   consumeNanobanana,
+  refundNanobanana,
   remainingNanobanana,
   canUseNanobananaGlobal,
   consumeNanobananaGlobal,
+  refundNanobananaGlobal,
   remainingNanobananaGlobal,
 } = require('../pollinations/usageLimits');
 const { fallbackEditToGenerate } = require('../pollinations/fallbackEdit');
@@ -41,21 +43,27 @@ module.exports = {
     }
 
     const userId = interaction.user.id;
+    const nanoModel = process.env.POLLINATIONS_MODEL_NANOBANANA || 'nanobanana';
+
+    // Con seed fija puede estar en caché: un acierto no gasta cupo
+    const cachedOut = await findCachedImage('edit', { imageUrl, prompt, modelId: nanoModel, seed, width, height });
 
     const okUser = canUseNanobanana(userId);
     const okGlobal = canUseNanobananaGlobal();
 
-    // 1) Si hay cupo => nanobanana
-    if (okUser && okGlobal) {
-      // Consumimos antes (para evitar race conditions)
-      consumeNanobanana(userId);
-      consumeNanobananaGlobal();
+    // 1) En caché o con cupo => nanobanana
+    if (cachedOut || (okUser && okGlobal)) {
+      if (!cachedOut) {
+        // Consumimos antes (para evitar race conditions)
+        consumeNanobanana(userId);
+        consumeNanobananaGlobal();
+      }
 
       try {
-        const out = await editImage({
+        const out = cachedOut || await editImage({
           imageUrl,
           prompt,
-          modelId: process.env.POLLINATIONS_MODEL_NANOBANANA || 'nanobanana',
+          modelId: nanoModel,
           seed,
           width,
           height,
@@ -65,12 +73,18 @@ module.exports = {
           throw new Error('editImage devolvió un resultado inválido');
         }
 
+        // Otra petición igual llenó la caché mientras tanto: devolvemos el cupo
+        if (!cachedOut && out.cached) {
+          refundNanobanana(userId);
+          refundNanobananaGlobal();
+        }
+
         const leftUser = remainingNanobanana(userId);
         const leftGlobal = remainingNanobananaGlobal();
         const usedUser = 2 - leftUser;
         const usedGlobal = 15 - leftGlobal;
 
-        const attachment = new AttachmentBuilder(out.buffer, { name: 'ceniza_edit.png' });
+        const attachment = new AttachmentBuilder(out.buffer, { name: `ceniza_edit.${out.ext || 'png'}` });
 
         await interaction.editReply({
           content:
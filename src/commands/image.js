@@ -1,6 +1,6 @@
 // src/commands/image.js
 const { SlashCommandBuilder } = require('discord.js');
-const { imageDescribe, imageAsk, imageOCR, imageAnalyze } = require('../vision/imageBridge');
+const { MAX_INLINE_BYTES, fetchImageBuffer, imageDescribe, imageAsk, imageOCR, imageAnalyze } = require('../vision/imageBridge');
 
 module.exports = {
   data: new SlashCommandBuilder()
@@ -55,13 +55,24 @@ module.exports = {
     const question = interaction.options.getString('question') || '';
     const hint = interaction.options.getString('hint') || '';
 
-    const src = file?.url || url;
+    let src = file?.url || url;
 
     if (!src) {
       await interaction.editReply('Adjunta una imagen o pasa una URL válida.');
       return;
     }
 
+    // Discord ya dice el tamaño del adjunto: si pasa del tope ni se descarga
+    if (file?.size > MAX_INLINE_BYTES) {
+      await interaction.editReply(`La imagen pesa demasiado (máx. ${Math.floor(MAX_INLINE_BYTES / (1024 * 1024))} MB).`);
+      return;
+    }
+
+    // Adjuntos: se bajan aquí en vez de en python (una descarga igual) y van por stdin
+    if (file?.url) {
+      src = await fetchImageBuffer(file.url).catch(() => file.url);
+    }
+
     try {
       let out = '';
       if (sub === 'describe') out = await imageDescribe(src, prompt);
@@ -28,12 +28,16 @@ module.exports = {
         .setDescription('Analiza un video o audio y responde a tu pregunta')
         .addStringOption((o) => o.setName('prompt').setDescription('¿Qué querés saber?').setRequired(true))
         .addStringOption((o) => o.setName('link').setDescription('URL del video (Youtube, etc)'))
-        .addAttachmentOption((o) => o.setName('file').setDescription('Archivo de audio/video')),
+        .addAttachmentOption((o) => o.setName('file').setDescription('Archivo de audio/video'))
+        .addStringOption((o) => o.setName('inicio').setDescription('Desde qué momento analizar (ej: 12:30)'))
+        .addStringOption((o) => o.setName('fin').setDescription('Hasta qué momento analizar (ej: 20:00)')),
 
     async execute(interaction, ctx) {
         const prompt = interaction.options.getString('prompt', true);
         const link = interaction.options.getString('link');
         const attachment = interaction.options.getAttachment('file');
+        const start = interaction.options.getString('inicio');
+        const end = interaction.options.getString('fin');
 
         if (!link && !attachment) {
             return interaction.reply({ content: '⚠️ Tenés que poner un **link** o subir un **archivo**.', ephemeral: true });
@@ -51,7 +55,9 @@ module.exports = {
                     mode: 'url',
                     input: link,
                     prompt,
-                    model: ctx.models.smart // Usa el modelo mas capaz (70b)
+                    model: ctx.models.smart, // Usa el modelo mas capaz (70b)
+                    start,
+                    end
                 });
             } else if (attachment) {
                 // Validar tipo (opcional, pero py bridge ya chequea si puede procesarlo)
@@ -62,7 +68,9 @@ module.exports = {
                     mode: 'file',
                     input: tempFile,
                     prompt,
-                    model: ctx.models.smart
+                    model: ctx.models.smart,
+                    start,
+                    end
                 });
             }
 
@@ -1,10 +1,12 @@
-const { generateImage, editImage } = require('./pollinationsBridge');
+const { generateImage, editImage, findCachedImage } = require('./pollinationsBridge');
 const {
   canUseNanobanana,
   consumeNanobanana,
+  refundNanobanana,
   remainingNanobanana,
   canUseNanobananaGlobal,
   consumeNanobananaGlobal,
+  refundNanobananaGlobal,
   remainingNanobananaGlobal,
 } = require('./usageLimits');
 const { fallbackEditToGenerate } = require('./fallbackEdit');
@@ -44,7 +46,7 @@ function labelFromModelId(modelId) {
  *  - { url: string }
  */
 function normalizeImageResult(res) {
-  const out = { ok: false, seed: 0, buffer: null, url: null, error: null };
+  const out = { ok: false, seed: 0, buffer: null, url: null, error: null, ext: 'png' };
 
   if (!res || typeof res !== 'object') {
     out.error = 'resultado vacío';
@@ -52,6 +54,7 @@ function normalizeImageResult(res) {
   }
 
   if (Number.isFinite(Number(res.seed))) out.seed = Number(res.seed);
+  if (res.ext) out.ext = String(res.ext);
 
   // 1) buffer directo
   if (res.buffer && Buffer.isBuffer(res.buffer)) {
@@ -122,7 +125,7 @@ async function replyWithImageOrLink(message, { content, img, filename = 'ceniza.
   if (img.buffer && Buffer.isBuffer(img.buffer)) {
     await message.reply({
       content,
-      files: [{ attachment: img.buffer, name: filename }],
+      files: [{ attachment: img.buffer, name: filename.replace(/\.png$/i, `.${img.ext || 'png'}`) }],
     });
     return true;
   }
@@ -226,17 +229,24 @@ async function runChatEdit({
   // si por alguna razón uid no existe, forzamos fallback (sin nanobanana)
   const canCheckUser = !!uid;
 
+  // con seed fija puede estar en caché: un acierto no gasta cupo
+  const cachedRes = canCheckUser
+    ? await findCachedImage('edit', { imageUrl: finalImageUrl, prompt: cleaned, modelId: 'nanobanana', seed: seedFinal })
+    : null;
+
   const okUser = canCheckUser ? canUseNanobanana(uid) : false;
   const okGlobal = canUseNanobananaGlobal();
 
-  if (okUser && okGlobal) {
+  if (cachedRes || (okUser && okGlobal)) {
     // usar nanobanana
-    consumeNanobanana(uid);
-    consumeNanobananaGlobal();
+    if (!cachedRes) {
+      consumeNanobanana(uid);
+      consumeNanobananaGlobal();
+    }
 
-    let res;
+    let res = cachedRes;
     try {
-      res = await editImage({ imageUrl: finalImageUrl, prompt: cleaned, modelId: 'nanobanana', seed: seedFinal });
+      if (!res) res = await editImage({ imageUrl: finalImageUrl, prompt: cleaned, modelId: 'nanobanana', seed: seedFinal });
     } catch (e) {
       console.error('[chat edit] nanobanana edit error:', e);
       res = null;
@@ -244,6 +254,12 @@ async function runChatEdit({
 
     const img = normalizeImageResult(res);
     if (img.ok) {
+      // otra petición igual llenó la caché mientras tanto: devolvemos el cupo
+      if (!cachedRes && res.cached) {
+        refundNanobanana(uid);
+        refundNanobananaGlobal();
+      }
+
       const leftUser = remainingNanobanana(uid);
       const leftGlobal = remainingNanobananaGlobal();
 
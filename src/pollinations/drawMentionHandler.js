@@ -1,5 +1,4 @@
 // src/pollinations/drawMentionHandler.js
-const fs = require('node:fs');
 const { AttachmentBuilder } = require('discord.js');
 const { generateImage } = require('./pollinationsBridge');
 const { normalize } = require('../utils/text');
@@ -137,8 +136,7 @@ async function maybeHandleDrawMention({ message, clientUserId }) {
       height: h,
     });
 
-    const buf = fs.readFileSync(out.file);
-    const attachment = new AttachmentBuilder(buf, { name: 'ceniza.png' });
+    const attachment = new AttachmentBuilder(out.buffer, { name: `ceniza.${out.ext || 'png'}` });
 
     await message.reply({
       content: `🖼️ **@dibujar** | **Modelo:** ${model.label} | **Tamaño:** ${note} | **Seed:** ${out.seed}\n**Prompt:** ${prompt}`.slice(0, 1900),
@@ -1,5 +1,4 @@
 // src/pollinations/editMentionHandler.js
-const fs = require('node:fs');
 const { AttachmentBuilder } = require('discord.js');
 const { editImage } = require('./pollinationsBridge');
 const { consumeNanobanana } = require('./usageLimits');
@@ -79,8 +78,7 @@ async function maybeHandleEditMention({ message, clientUserId }) {
   try {
     await message.channel.sendTyping();
     const out = await editImage({ prompt, imageUrl, seed: 0 });
-    const buf = fs.readFileSync(out.file);
-    const attachment = new AttachmentBuilder(buf, { name: 'ceniza_edit.png' });
+    const attachment = new AttachmentBuilder(out.buffer, { name: `ceniza_edit.${out.ext || 'png'}` });
 
     await message.reply({
       content:
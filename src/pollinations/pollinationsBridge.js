@@ -1,20 +1,82 @@
 const path = require('path');
 const fs = require('fs');
-const { execFile } = require('child_process');
+const { spawn } = require('child_process');
 
-function execFilePromise(cmd, args, opts = {}) {
+// Tope de stdout: imagen 2048x2048 + cabecera JSON, con margen
+const MAX_STDOUT_BYTES = 64 * 1024 * 1024;
+
+// Corre python y junta stdout como Buffer (sin pasar por string ni maxBuffer fijo)
+function spawnCollect(cmd, args, opts = {}) {
   return new Promise((resolve, reject) => {
-    execFile(cmd, args, { ...opts, maxBuffer: 50 * 1024 * 1024 }, (error, stdout, stderr) => {
+    const child = spawn(cmd, args, { ...opts, stdio: ['ignore', 'pipe', 'pipe'] });
+    const chunks = [];
+    const errChunks = [];
+    let size = 0;
+    let tooLarge = false;
+
+    child.stdout.on('data', (chunk) => {
+      size += chunk.length;
+      if (size > MAX_STDOUT_BYTES) {
+        tooLarge = true;
+        child.kill();
+        return;
+      }
+      chunks.push(chunk);
+    });
+    child.stderr.on('data', (chunk) => errChunks.push(chunk));
+
+    child.on('error', (error) => {
+      reject({ error, stdout: Buffer.concat(chunks), stderr: Buffer.concat(errChunks).toString() });
+    });
+    child.on('close', (code) => {
+      const stdout = Buffer.concat(chunks);
+      const stderr = Buffer.concat(errChunks).toString();
       // OJO: aunque python ahora sale 0, dejamos robusto igual
-      if (error) {
-        reject({ error, stdout: String(stdout || ''), stderr: String(stderr || '') });
+      if (tooLarge || code !== 0) {
+        const error = new Error(tooLarge ? `stdout > ${MAX_STDOUT_BYTES} bytes` : `exit code ${code}`);
+        reject({ error, stdout, stderr });
         return;
       }
-      resolve({ stdout: String(stdout || ''), stderr: String(stderr || '') });
+      resolve({ stdout, stderr });
     });
   });
 }
 
+// Salida --output frame: [uint32 BE largo][JSON] + un frame [uint32 BE largo][imagen]
+// por cada imagen; en el JSON cada imagen (resultado, variante, cuadrícula) trae
+// "frame" con su índice.
+function parseFrames(buf) {
+  if (!buf || buf.length < 4 || buf[0] === 0x7b /* '{' */) return null;
+  const frames = [];
+  let pos = 0;
+  while (pos + 4 <= buf.length) {
+    const len = buf.readUInt32BE(pos);
+    pos += 4;
+    if (pos + len > buf.length) return null;
+    frames.push(buf.subarray(pos, pos + len));
+    pos += len;
+  }
+  if (!frames.length) return null;
+
+  let header;
+  try {
+    header = JSON.parse(frames[0].toString('utf8'));
+  } catch (_e) {
+    return null;
+  }
+  const attach = (target) => {
+    if (target && Number.isInteger(target.frame) && frames[target.frame + 1]) {
+      target.buffer = frames[target.frame + 1];
+    }
+  };
+  if (header && typeof header === 'object') {
+    attach(header);
+    attach(header.grid);
+    if (Array.isArray(header.variants)) header.variants.forEach(attach);
+  }
+  return header;
+}
+
 function parseJsonLenient(raw) {
   const s = String(raw || '').trim();
   if (!s) return null;
@@ -29,6 +91,30 @@ function parseJsonLenient(raw) {
   return null;
 }
 
+// Buffer de una imagen de la salida: frame, base64 o archivo (en ese orden)
+function entryBuffer(entry) {
+  if (Buffer.isBuffer(entry.buffer) && entry.buffer.length > 0) return entry.buffer;
+
+  if (entry.buffer_base64) {
+    try {
+      const buf = Buffer.from(String(entry.buffer_base64), 'base64');
+      if (buf && buf.length > 0) return buf;
+    } catch (_e) {
+      // continue
+    }
+  }
+
+  if (entry.file) {
+    const p = String(entry.file);
+    const buf = fs.readFileSync(p);
+    // ya está en memoria; python purga lo que quede por edad
+    fs.unlink(p, () => {});
+    return buf;
+  }
+
+  return null;
+}
+
 function normalizeBridgeOut(out, stderr) {
   if (!out || typeof out !== 'object') {
     return { ok: false, error: 'bridge_no_json', stderr };
@@ -38,49 +124,77 @@ function normalizeBridgeOut(out, stderr) {
     return { ok: false, error: out.error || 'bridge_error', detail: out.detail, stderr };
   }
 
-  // prefer base64
-  if (out.buffer_base64) {
-    try {
-      const buf = Buffer.from(String(out.buffer_base64), 'base64');
-      if (buf && buf.length > 0) {
-        return {
-          ok: true,
-          buffer: buf,
-          seed: out.seed ?? 0,
-          model: out.model,
-          width: out.width,
-          height: out.height,
-          file: out.file || null,
-        };
-      }
-    } catch (_e) {
-      // continue
-    }
+  let buf;
+  try {
+    buf = entryBuffer(out);
+  } catch (e) {
+    return { ok: false, error: `no pude leer file=${out.file}`, detail: String(e), stderr };
   }
+  if (!buf) return { ok: false, error: 'bridge_ok_but_no_buffer', stderr };
+
+  return {
+    ok: true,
+    buffer: buf,
+    seed: out.seed ?? 0,
+    model: out.model,
+    width: out.width,
+    height: out.height,
+    file: null,
+    ext: out.ext || 'png',
+    // salió de la caché de python: no hubo llamada a Pollinations
+    cached: !!out.cached,
+  };
+}
 
-  // fallback: file
-  if (out.file) {
+// --variants: cuadrícula + cada variante; las que fallaron vienen con ok=false y error
+function normalizeVariantsOut(out, stderr) {
+  if (!out || typeof out !== 'object') {
+    return { ok: false, error: 'bridge_no_json', stderr };
+  }
+
+  if (!out.ok || !Array.isArray(out.variants)) {
+    return { ok: false, error: out.error || 'bridge_error', detail: out.detail, stderr };
+  }
+
+  const read = (entry) => {
     try {
-      const p = String(out.file);
-      const buf = fs.readFileSync(p);
-      return {
-        ok: true,
-        buffer: buf,
-        seed: out.seed ?? 0,
-        model: out.model,
-        width: out.width,
-        height: out.height,
-        file: p,
-      };
-    } catch (e) {
-      return { ok: false, error: `no pude leer file=${out.file}`, detail: String(e), stderr };
+      return entryBuffer(entry);
+    } catch (_e) {
+      return null;
     }
+  };
+
+  const variants = out.variants.map((v) => {
+    const buffer = v.ok ? read(v) : null;
+    return {
+      index: v.index,
+      ok: !!buffer,
+      buffer,
+      seed: v.seed ?? 0,
+      model: v.model,
+      width: v.width,
+      height: v.height,
+      ext: v.ext || 'png',
+      cached: !!v.cached,
+      error: buffer ? null : (v.error || 'sin imagen'),
+    };
+  });
+
+  if (!variants.some((v) => v.ok)) {
+    return { ok: false, error: 'bridge_ok_but_no_buffer', stderr };
   }
 
-  return { ok: false, error: 'bridge_ok_but_no_buffer', stderr };
+  const gridBuf = out.grid ? read(out.grid) : null;
+  return {
+    ok: true,
+    grid: gridBuf ? { buffer: gridBuf, ext: out.grid.ext || 'png', width: out.grid.width, height: out.grid.height } : null,
+    variants,
+    failed: variants.filter((v) => !v.ok).length,
+    elapsedMs: out.elapsed_ms,
+  };
 }
 
-async function runBridge(mode, params) {
+async function runBridge(mode, params, normalize = normalizeBridgeOut) {
   const script = path.join(process.cwd(), 'python', 'pollinations_bridge.py');
 
   const args = [
@@ -92,32 +206,44 @@ async function runBridge(mode, params) {
     '--width', String(params.width ?? 1024),
     '--height', String(params.height ?? 1024),
     '--watermark', 'CenizaGPT',
+    '--output', 'frame',
   ];
 
   if (mode === 'edit') {
     args.push('--image', String(params.imageUrl || ''));
   }
 
+  if (params.cacheOnly) {
+    args.push('--cache-only');
+  }
+
+  if (Array.isArray(params.models) && params.models.length) {
+    args.push('--models', params.models.join(','));
+  } else if (params.variants > 1) {
+    args.push('--variants', String(params.variants));
+  }
+
   let res;
   try {
-    res = await execFilePromise('python3', args, { cwd: process.cwd() });
+    res = await spawnCollect('python3', args, { cwd: process.cwd() });
   } catch (e) {
     // esto ya solo sería si python ni corre, o revienta hard
     const msg = `pollinations_bridge exec failed: ${e?.error?.message || 'unknown'}`;
     const err = new Error(msg);
-    err._stdout = e.stdout;
+    err._stdout = String(e.stdout || '').slice(0, 2000);
     err._stderr = e.stderr;
     throw err;
   }
 
-  const parsed = parseJsonLenient(res.stdout);
-  const norm = normalizeBridgeOut(parsed, res.stderr);
+  // frames si python los soporta; si no, JSON (salida antigua)
+  const parsed = parseFrames(res.stdout) || parseJsonLenient(res.stdout.toString('utf8'));
+  const norm = normalize(parsed, res.stderr);
 
   if (!norm.ok) {
     const err = new Error(`pollinations_bridge failed: ${norm.error}`);
     err._detail = norm.detail;
     err._stderr = norm.stderr;
-    err._stdout = res.stdout;
+    err._stdout = res.stdout.toString('utf8').slice(0, 2000);
     throw err;
   }
 
@@ -132,7 +258,28 @@ async function editImage({ imageUrl, prompt, modelId, seed, width, height }) {
   return runBridge('edit', { imageUrl, prompt, modelId, seed, width, height });
 }
 
+// Sólo caché de python (nunca llama a Pollinations): para comprobar un acierto
+// antes de tocar cupos. Devuelve el mismo resultado que generateImage/editImage,
+// o null si no está (o si la seed es aleatoria y no puede estar).
+async function findCachedImage(mode, { imageUrl, prompt, modelId, seed, width, height }) {
+  if (!seed || Number(seed) <= 0) return null;
+  try {
+    return await runBridge(mode, { imageUrl, prompt, modelId, seed, width, height, cacheOnly: true });
+  } catch (_e) {
+    // cache_miss o fallo del sondeo: seguimos por el camino normal
+    return null;
+  }
+}
+
+// N seeds (o un modelo por variante con `models`) en un solo proceso, en paralelo.
+// Devuelve { grid: { buffer, ext } | null, variants: [{ index, ok, buffer, seed, model, ext, error }], failed }
+async function generateVariants({ prompt, modelId, models, width, height, seed, variants = 4 }) {
+  return runBridge('generate', { prompt, modelId, models, width, height, seed, variants }, normalizeVariantsOut);
+}
+
 module.exports = {
+  findCachedImage,
   generateImage,
+  generateVariants,
   editImage,
 };
@@ -157,6 +157,13 @@ function consumeNanobanana(userId, amount = 1) {
   setUserEntry(userId, u);
 }
 
+// Devolver cupo (p. ej. resultado servido desde la caché de pollinations_bridge)
+function refundNanobanana(userId, amount = 1) {
+  const u = getUserEntry(userId);
+  u.edit = Math.max(0, u.edit - Number(amount || 1));
+  setUserEntry(userId, u);
+}
+
 function remainingNanobanana(userId) {
   const u = getUserEntry(userId);
   return Math.max(0, LIMITS.edit_per_day - u.edit);
@@ -177,6 +184,12 @@ function consumeNanobananaGen(userId, amount = 1) {
   setUserEntry(userId, u);
 }
 
+function refundNanobananaGen(userId, amount = 1) {
+  const u = getUserEntry(userId);
+  u.gen = Math.max(0, u.gen - Number(amount || 1));
+  setUserEntry(userId, u);
+}
+
 function remainingNanobananaGen(userId) {
   const u = getUserEntry(userId);
   return Math.max(0, LIMITS.gen_per_day - u.gen);
@@ -193,6 +206,10 @@ function consumeNanobananaGlobal(amount = 1) {
   setGlobalUsed(getGlobalUsed() + Number(amount || 1));
 }
 
+function refundNanobananaGlobal(amount = 1) {
+  setGlobalUsed(getGlobalUsed() - Number(amount || 1));
+}
+
 function remainingNanobananaGlobal() {
   return Math.max(0, LIMITS.global_per_day - getGlobalUsed());
 }
@@ -201,16 +218,19 @@ module.exports = {
   // edit (compat)
   canUseNanobanana,
   consumeNanobanana,
+  refundNanobanana,
   remainingNanobanana,
 
   // gen (nuevo)
   canUseNanobananaGen,
   consumeNanobananaGen,
+  refundNanobananaGen,
   remainingNanobananaGen,
 
   // global
   canUseNanobananaGlobal,
   consumeNanobananaGlobal,
+  refundNanobananaGlobal,
   remainingNanobananaGlobal,
 
   // debug
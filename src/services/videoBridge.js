@@ -29,13 +29,17 @@ function parseJsonFromStdout(stdout) {
  * @param {string} params.mode - 'url' o 'file'
  * @param {string} params.prompt - Pregunta del usuario
  * @param {string} [params.model] - Modelo opcional
+ * @param {string} [params.start] - Inicio del tramo (segundos, mm:ss o hh:mm:ss)
+ * @param {string} [params.end] - Fin del tramo (segundos, mm:ss o hh:mm:ss)
  */
-function analyzeVideo({ input, mode, prompt, model }, { timeoutMs = 300_000 } = {}) {
+function analyzeVideo({ input, mode, prompt, model, start, end }, { timeoutMs = 300_000 } = {}) {
     const pythonBin = pickPythonBin();
     const script = path.join(process.cwd(), 'python', 'video_bridge.py');
 
     const args = ['--mode', mode, '--input', input, '--prompt', prompt, '--proxy', 'socks5://127.0.0.1:40000'];
     if (model) args.push('--model', model);
+    if (start) args.push('--start', String(start));
+    if (end) args.push('--end', String(end));
 
     const cookiesPath = path.join(process.cwd(), 'cookies.txt');
     if (fs.existsSync(cookiesPath)) {
@@ -78,7 +82,8 @@ function analyzeVideo({ input, mode, prompt, model }, { timeoutMs = 300_000 } =
                     return reject(re);
                 }
 
-                resolve(parsed.answer);
+                // note: p. ej. sólo se analizaron los primeros minutos de un video largo
+                resolve(parsed.note ? `${parsed.note}\n\n${parsed.answer}` : parsed.answer);
             }
         );
     });
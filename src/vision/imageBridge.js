@@ -2,12 +2,60 @@
 const { execFile } = require('node:child_process');
 const path = require('node:path');
 
-function runPython(args, { timeoutMs = 60_000 } = {}) {
+// Mismo tope que image_bridge.py (IMAGE_MAX_DOWNLOAD_BYTES)
+const MAX_INLINE_BYTES = Number(process.env.IMAGE_MAX_DOWNLOAD_BYTES) || 25 * 1024 * 1024;
+
+// Descarga la imagen desde el proceso de Node (conexiones keep-alive ya abiertas)
+// y se la pasa a python por stdin: se baja una vez igual que antes, sólo cambia
+// qué proceso lo hace. Se lee por trozos y se corta en cuanto pasa de maxBytes,
+// sin fiarse de content-length (puede faltar o mentir).
+async function fetchImageBuffer(url, { timeoutMs = 15_000, maxBytes = MAX_INLINE_BYTES } = {}) {
+  const res = await fetch(url, { signal: AbortSignal.timeout(timeoutMs) });
+  if (!res.ok) throw new Error(`HTTP ${res.status}`);
+  const len = Number(res.headers.get('content-length') || 0);
+  if (len > maxBytes) {
+    await res.body?.cancel().catch(() => {});
+    throw new Error(`imagen demasiado grande (${len} bytes)`);
+  }
+  if (!res.body) return Buffer.alloc(0);
+
+  const reader = res.body.getReader();
+  const chunks = [];
+  let total = 0;
+  for (;;) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    total += value.byteLength;
+    if (total > maxBytes) {
+      await reader.cancel().catch(() => {});
+      throw new Error(`imagen demasiado grande (más de ${maxBytes} bytes)`);
+    }
+    chunks.push(value);
+  }
+  return Buffer.concat(chunks, total);
+}
+
+// src puede ser URL/path (string) o Buffer: los Buffer van por stdin como
+// frames [uint32 BE largo][bytes] y el argumento es '-'.
+function srcArgs(srcs, inputs) {
+  const args = [];
+  for (const src of srcs) {
+    if (Buffer.isBuffer(src)) {
+      inputs.push(src);
+      args.push('--src', '-');
+    } else {
+      args.push('--src', src);
+    }
+  }
+  return args;
+}
+
+function runPython(args, { timeoutMs = 60_000, raw = false, inputs = [] } = {}) {
   return new Promise((resolve, reject) => {
     const py = process.env.PYTHON_BIN || 'python3';
     const script = path.join(process.cwd(), 'python', 'image_bridge.py');
 
-    execFile(py, [script, ...args], { timeout: timeoutMs, maxBuffer: 10 * 1024 * 1024 }, (err, stdout, stderr) => {
+    const child = execFile(py, [script, ...args], { timeout: timeoutMs, maxBuffer: 10 * 1024 * 1024 }, (err, stdout, stderr) => {
       if (err) {
         const msg = stderr?.toString() || err.message;
         return reject(new Error(msg));
@@ -19,28 +67,54 @@ function runPython(args, { timeoutMs = 60_000 } = {}) {
         return reject(new Error(`Salida inválida de image_bridge.py: ${String(stdout || '').slice(0, 300)}`));
       }
       if (!data?.ok) return reject(new Error(data?.error || 'image_bridge fallo'));
-      resolve(data.text);
+      resolve(raw ? data : data.text);
     });
+
+    child.stdin.on('error', () => {}); // si python muere antes de leer, el error sale por el callback
+    for (const buf of inputs) {
+      const header = Buffer.alloc(4);
+      header.writeUInt32BE(buf.length, 0);
+      child.stdin.write(header);
+      child.stdin.write(buf);
+    }
+    child.stdin.end();
   });
 }
 
+function runMode(mode, src, prompt) {
+  const inputs = [];
+  return runPython([mode, ...srcArgs([src], inputs), '--prompt', prompt], { inputs });
+}
+
 async function imageDescribe(src, prompt = '') {
-  return runPython(['describe', '--src', src, '--prompt', prompt]);
+  return runMode('describe', src, prompt);
 }
 
 async function imageAsk(src, question) {
-  return runPython(['ask', '--src', src, '--prompt', question]);
+  return runMode('ask', src, question);
 }
 
 async function imageOCR(src, prompt = '') {
-  return runPython(['ocr', '--src', src, '--prompt', prompt]);
+  return runMode('ocr', src, prompt);
 }
 
 async function imageAnalyze(src, prompt = '') {
-  return runPython(['analyze', '--src', src, '--prompt', prompt]);
+  return runMode('analyze', src, prompt);
+}
+
+// Varias imágenes y/o modos en un solo proceso.
+// Devuelve [{ src, ok, results: { [modo]: { ok, text } }, error? }]
+async function imageBatch(srcs, modes = ['describe'], prompt = '') {
+  const inputs = [];
+  const args = ['batch', '--modes', modes.join(','), '--prompt', prompt, ...srcArgs(srcs, inputs)];
+  const data = await runPython(args, { timeoutMs: 120_000, raw: true, inputs });
+  return data.results || [];
 }
 
 module.exports = {
+  MAX_INLINE_BYTES,
+  fetchImageBuffer,
+  imageBatch,
   imageDescribe,
   imageAsk,
   imageOCR,
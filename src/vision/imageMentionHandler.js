@@ -7,8 +7,8 @@
 //   describir, leer texto, responder preguntas, resumir, etc.
 // - Se activa sólo cuando el router decide VISION, o cuando force=true.
 
-const { imageDescribe } = require('./imageBridge');
-const { pickImageFromMessage, extractFirstUrlFromText } = require('./imageSource');
+const { imageDescribe, imageBatch } = require('./imageBridge');
+const { pickImageFromMessage, pickImagesFromMessage, extractFirstUrlFromText } = require('./imageSource');
 
 async function maybeHandleImageMention({ message, clientUserId, prompt = '', force = false }) {
   // Si no estamos forzando, requiere mención directa
@@ -33,8 +33,19 @@ async function maybeHandleImageMention({ message, clientUserId, prompt = '', for
   // Instrucción del usuario: si no hay, pedimos una descripción breve.
   const userPrompt = String(prompt || '').trim() || 'describe la imagen brevemente y en español.';
 
+  // Varios adjuntos: una sola llamada batch en vez de un proceso por imagen
+  const many = pickImagesFromMessage(message);
+
   try {
-    let out = await imageDescribe(src, userPrompt);
+    let out;
+    if (many.length > 1) {
+      const results = await imageBatch(many, ['describe'], userPrompt);
+      out = results
+        .map((r, i) => `**Imagen ${i + 1}:** ${r.results?.describe?.text || 'No pude analizarla.'}`)
+        .join('\n\n');
+    } else {
+      out = await imageDescribe(src, userPrompt);
+    }
     if (out.length > 1800) out = out.slice(0, 1800) + '\n\n…(recortado)';
     await message.reply(out);
     return true;
@@ -9,14 +9,16 @@ function isLikelyImageUrl(url) {
   );
 }
 
+function isImageAttachment(a) {
+  const ct = a.contentType || '';
+  return ct.startsWith('image/') || /\.(png|jpe?g|gif|webp|bmp)$/i.test(a.url || '');
+}
+
 function pickImageFromMessage(msg) {
   if (!msg) return null;
 
   // 1) attachments
-  const att = msg.attachments?.find?.((a) => {
-    const ct = a.contentType || '';
-    return ct.startsWith('image/') || /\.(png|jpe?g|gif|webp|bmp)$/i.test(a.url || '');
-  });
+  const att = msg.attachments?.find?.(isImageAttachment);
   if (att?.url) return att.url;
 
   // 2) embeds (si alguien pegó link)
@@ -27,6 +29,12 @@ function pickImageFromMessage(msg) {
   return null;
 }
 
+// Todas las imágenes adjuntas (para analizarlas en un solo batch)
+function pickImagesFromMessage(msg) {
+  if (!msg?.attachments?.filter) return [];
+  return [...msg.attachments.filter(isImageAttachment).values()].map((a) => a.url).filter(Boolean);
+}
+
 function extractFirstUrlFromText(text) {
   const m = String(text || '').match(/https?:\/\/[^\s<>()"]+/i);
   return m ? m[0] : null;
@@ -35,5 +43,6 @@ function extractFirstUrlFromText(text) {
 module.exports = {
   isLikelyImageUrl,
   pickImageFromMessage,
+  pickImagesFromMessage,
   extractFirstUrlFromText,
 };